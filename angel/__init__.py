@@ -1,20 +1,35 @@
 import os
+import re
+import time
+import contextlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 from greek_normalisation.normalise import Normaliser
+from greek_normalisation.norm_data import ELISION, MOVABLE
 import numpy as np
 from gensim.models import KeyedVectors
 from tensorflow.keras.models import load_model
 import tensorflow as tf
-import tarfile
 import gdown
+from angel.vectors import CompactVectors
+from angel.weights import WeightsFile, write_weights_file
+from angel.saved import SavedModels, SavedStage, FusedOutput, export_saved_models, default_buckets
+from angel.store import models_installed, install_models, install_archive, fetch_source_manifest
+from angel.metrics import Metrics
+from angel.profiler import Profiler
+from angel.results import TaggedTokens
 
 
 class Morphs:
     """Hold data for one aspect of morphology."""
-    def __init__(self, title, tags, lstm1, dnn, lstm2):
+    def __init__(self, title, tags, lstm1, dnn, lstm2=None, lstm2_file=None, weights=None):
         self.title = title
         self.tags = tags
         self.lstm1 = lstm1
-        self.lstm2 = lstm2
+        self._lstm2 = lstm2
+        self.lstm2_file = lstm2_file
+        self.weights = weights
         self.dnn = dnn
         self.output1 = []
         self.output2 = []
@@ -25,84 +40,323 @@ class Morphs:
         self.confidence1 = []
         self.confidence2 = []
         self.confidence3 = []
+        self.lstm2_windows = 0
+        self.lstm2_skipped = []
+        self.dnn_rows = 0
+        self.load_seconds = {}
 
+    @property
+    def lstm2(self):
+        """Load LSTM2 the first time it's needed if it wasn't loaded up front."""
+        if self._lstm2 is None and self.weights is not None:
+            self._lstm2 = self.weights.load(f'{self.title}-lstm2')
+        elif self._lstm2 is None:
+            self._lstm2 = load_model(self.lstm2_file)
+        return self._lstm2
 
-def create_morph_classes():
-    """Create a class instance for each part of speech aspect."""
-    print('Part-of-speech models loading...')
-    pos_lstm1 = load_model(os.path.join(model_folder, 'pos-lstm1-3x128-0.927val0.939-AGDTfirst26last7.h5'))
-    pos_dnn = load_model(os.path.join(model_folder, 'pos-dnn-2x20-0.939val0.942-AGDTfirst26last7.h5'))
-    pos_lstm2 = load_model(os.path.join(model_folder, 'pos-lstm2-3x128-0.958val0.955-AGDTfirst26last7.h5'))
-
-    print('Person models loading...')
-    person_lstm1 = load_model(os.path.join(model_folder, 'person-lstm1-3x128-0.983val0.990-AGDTfirst26last7.h5'))
-    person_dnn = load_model(os.path.join(model_folder, 'person-dnn-2x20-0.994val0.992-AGDTfirst26last7.h5'))
-    person_lstm2 = load_model(os.path.join(model_folder, 'person-lstm2-3x128-0.994val0.994-AGDTfirst26last7.h5'))
-
-    print('Number models loading...')
-    number_lstm1 = load_model(os.path.join(model_folder, 'number-lstm1-3x128-0.955val0.980-AGDTfirst26last7.h5'))
-    number_dnn = load_model(os.path.join(model_folder, 'number-dnn-2x20-0.977val0.981-AGDTfirst26last7.h5'))
-    number_lstm2 = load_model(os.path.join(model_folder, 'number-lstm2-3x128-0.985val0.987-AGDTfirst26last7.h5'))
-
-    print('Tense models loading...')
-    tense_lstm1 = load_model(os.path.join(model_folder, 'tense-lstm1-3x128-0.976val0.990-AGDTfirst26last7.h5'))
-    tense_dnn = load_model(os.path.join(model_folder, 'tense-dnn-2x20-0.990val0.992-AGDTfirst26last7.h5'))
-    tense_lstm2 = load_model(os.path.join(model_folder, 'tense-lstm2-3x128-0.986val0.992-AGDTfirst26last7.h5'))
-
-    print('Mood models loading...')
-    mood_lstm1 = load_model(os.path.join(model_folder, 'mood-lstm1-3x128-0.981val0.992-AGDTfirst26last7.h5'))
-    mood_dnn = load_model(os.path.join(model_folder, 'mood-dnn-2x20-0.994val0.992-AGDTfirst26last7.h5'))
-    mood_lstm2 = load_model(os.path.join(model_folder, 'mood-lstm2-3x128-0.994val0.995-AGDTfirst26last7.h5'))
-
-    print('Voice models loading...')
-    voice_lstm1 = load_model(os.path.join(model_folder, 'voice-lstm1-3x128-0.978val0.991-AGDTfirst26last7.h5'))
-    voice_dnn = load_model(os.path.join(model_folder, 'voice-dnn-2x20-0.992val0.993-AGDTfirst26last7.h5'))
-    voice_lstm2 = load_model(os.path.join(model_folder, 'voice-lstm2-3x128-0.989val0.993-AGDTfirst26last7.h5'))
-
-    print('Gender models loading...')
-    gender_lstm1 = load_model(os.path.join(model_folder, 'gender-lstm1-3x128-0.923val0.934-AGDTfirst26last7.h5'))
-    gender_dnn = load_model(os.path.join(model_folder, 'gender-dnn-2x20-0.952val0.937-AGDTfirst26last7.h5'))
-    gender_lstm2 = load_model(os.path.join(model_folder, 'gender-lstm2-4x128-0.960val0.958-AGDTfirst26last7.h5'))
-
-    print('Case models loading...')
-    case_lstm1 = load_model(os.path.join(model_folder, 'case-lstm1-3x128-0.934val0.962-AGDTfirst26last7.h5'))
-    case_dnn = load_model(os.path.join(model_folder, 'case-dnn-2x20-0.957val0.963-AGDTfirst26last7.h5'))
-    case_lstm2 = load_model(os.path.join(model_folder, 'case-lstm2-2x128-0.975val0.977-AGDTfirst26last7.h5'))
-
-    print('Degree models loading...')
-    degree_lstm1 = load_model(os.path.join(model_folder, 'degree-lstm1-3x128-0.998val0.999-AGDTfirst26last7.h5'))
-    degree_dnn = load_model(os.path.join(model_folder, 'degree-dnn-2x20-0.999val0.999-AGDTfirst26last7.h5'))
-    degree_lstm2 = load_model(os.path.join(model_folder, 'degree-lstm2-2x128-0.998val0.999-AGDTfirst26last7.h5'))
-
-    # The possible tags for each aspect of morphology
-    pos_tags = ('l', 'n', 'a', 'r', 'c', 'i', 'p', 'v', 'd', 'm', 'g', 'u')
-    person_tags = ('1', '2', '3')
-    number_tags = ('s', 'p', 'd')
-    tense_tags = ('p', 'i', 'r', 'l', 't', 'f', 'a')
-    mood_tags = ('i', 's', 'n', 'm', 'p', 'o')
-    voice_tags = ('a', 'p', 'm', 'e')
-    gender_tags = ('m', 'f', 'n')
-    case_tags = ('n', 'g', 'd', 'a', 'v')
-    degree_tags = ('p', 'c', 's')
-
-    # Create a class instance for each aspect of morphology
-    fpos = Morphs('pos', pos_tags, pos_lstm1, pos_dnn, pos_lstm2)
-    fperson = Morphs('person', person_tags, person_lstm1, person_dnn, person_lstm2)
-    fnumber = Morphs('number', number_tags, number_lstm1, number_dnn, number_lstm2)
-    ftense = Morphs('tense', tense_tags, tense_lstm1, tense_dnn, tense_lstm2)
-    fmood = Morphs('mood', mood_tags, mood_lstm1, mood_dnn, mood_lstm2)
-    fvoice = Morphs('voice', voice_tags, voice_lstm1, voice_dnn, voice_lstm2)
-    fgender = Morphs('gender', gender_tags, gender_lstm1, gender_dnn, gender_lstm2)
-    fcase = Morphs('case', case_tags, case_lstm1, case_dnn, case_lstm2)
-    fdegree = Morphs('degree', degree_tags, degree_lstm1, degree_dnn, degree_lstm2)
-
-    return fpos, fperson, fnumber, ftense, fmood, fvoice, fgender, fcase, fdegree
+    @lstm2.setter
+    def lstm2(self, model):
+        self._lstm2 = model
+
+
+class TaggedDocument:
+    """Hold a tagged text along with the outputs of every stage so an edit only retags the tokens it can affect."""
+    def __init__(self, greek_text, annotator='Vanessa Gorman', morphs=None):
+        self.morphs = morphs if morphs is not None else create_morph_classes()
+        self.annotator = annotator
+        self.text = greek_text
+        self.tokens, offsets = tokenize(greek_text)
+        self.offsets = np.array(offsets, dtype=np.int64).reshape(-1, 2)
+        self.output1, self.output2, self.lstm2_input = self.first_stages(self.tokens)
+        self.output3 = run_stage(self.morphs, 'lstm2', context_windows(self.lstm2_input, 0, len(self.tokens)))
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, i):
+        """Return the token at i and its tag."""
+        tag_string = ''
+        for aspect, output3 in zip(self.morphs, self.output3):
+            try:
+                tag_string += aspect.tags[int(np.argmax(output3[i]))]
+            except IndexError:
+                tag_string += '-'
+        return self.tokens[i], tag_string
+
+    def __iter__(self):
+        for i in range(len(self.tokens)):
+            yield self[i]
+
+    def first_stages(self, split_text):
+        """Run tokens through LSTM1 and the DNN and return those outputs along with each token's LSTM2 input."""
+        if not split_text:
+            output1 = [np.zeros((0, len(aspect.tags) + 1), dtype=np.float32) for aspect in self.morphs]
+            return output1, output1, np.zeros((0, 192), dtype=np.float32)
+
+        normalized = normalize_tokens(split_text)
+        one_hots, annotator_rows = encode_tokens(normalized, [0, len(split_text)], [self.annotator])
+        output1 = run_stage(self.morphs, 'lstm1', one_hots)
+        output2 = run_stage(self.morphs, 'dnn', dnn_input_rows(output1, annotator_rows))
+        return output1, output2, lstm2_input_rows(output2, annotator_rows, lookup_vectors(normalized))
+
+    def apply_edit(self, span, new_text):
+        """Replace the tokens from span[0] up to span[1] with new_text and retag only the tokens that can change.
+
+        The text and the offsets of every token are kept up to date. The text is kept as written, except that a space
+        goes between new_text and a neighbouring word it would otherwise run into, so tokenizing the text always gives
+        back the tokens. Returns the (start, stop) token indices of the tags which were recomputed."""
+        start, stop = span
+
+        # Find the characters being replaced
+        if stop > start:
+            first_character, last_character = self.offsets[start, 0], self.offsets[stop-1, 1]
+        else:
+            first_character = last_character = self.offsets[start, 0] if start < len(self.tokens) else len(self.text)
+
+        # Punctuation and whitespace already split tokens, so only a word running straight into another word needs a
+        # space. Text which deletes tokens still leaves one if the words on either side would otherwise meet.
+        before = self.text[first_character-1] if first_character > 0 else ' '
+        after = self.text[last_character] if last_character < len(self.text) else ' '
+        if not new_text:
+            new_text = ' ' if word_character_pattern.match(before) and word_character_pattern.match(after) else ''
+        else:
+            if word_character_pattern.match(before) and word_character_pattern.match(new_text[0]):
+                new_text = ' ' + new_text
+            if word_character_pattern.match(after) and word_character_pattern.match(new_text[-1]):
+                new_text = new_text + ' '
+        self.text = self.text[:first_character] + new_text + self.text[last_character:]
+
+        # Only the new text needs to be split
+        new_tokens, new_offsets = tokenize(new_text)
+        new_offsets = np.array(new_offsets, dtype=np.int64).reshape(-1, 2) + first_character
+        self.offsets[stop:] += len(new_text) - (last_character - first_character)
+        self.offsets = splice(self.offsets, start, stop, new_offsets)
+
+        output1, output2, lstm2_input = self.first_stages(new_tokens)
+        self.tokens[start:stop] = new_tokens
+        self.lstm2_input = splice(self.lstm2_input, start, stop, lstm2_input)
+        for k, aspect in enumerate(self.morphs):
+            self.output1[k] = splice(self.output1[k], start, stop, output1[k])
+            self.output2[k] = splice(self.output2[k], start, stop, output2[k])
+            self.output3[k] = splice(self.output3[k], start, stop, output2[k])
+
+        # LSTM2 only sees 7 tokens either way, so only the windows within 7 tokens of the new ones can change
+        first_window, last_window = max(start-7, 0), min(start+len(new_tokens)+7, len(self.tokens))
+        if last_window > first_window:
+            windows = context_windows(self.lstm2_input, first_window, last_window)
+            for k, output3 in enumerate(run_stage(self.morphs, 'lstm2', windows)):
+                self.output3[k][first_window:last_window] = output3
+        return first_window, last_window
+
+
+def observe(name, aspect=None, **details):
+    """Return a span timing a stage for everything in observers, or a shared do-nothing context if that's empty."""
+    if not observers:
+        return no_observation
+    if len(observers) == 1:
+        return observers[0].span(name, aspect, **details)
+    spans = contextlib.ExitStack()
+    for observer in observers:
+        spans.enter_context(observer.span(name, aspect, **details))
+    return spans
+
+
+def observed(function):
+    """Make every call of a function a span of its own, so calling it from outside any span counts as a call."""
+    @wraps(function)
+    def observed_function(*args, **kwargs):
+        if not observers:
+            return function(*args, **kwargs)
+        with observe(function.__name__):
+            return function(*args, **kwargs)
+    return observed_function
+
+
+def count(**counts):
+    """Add to the counts of everything in observers. Callers check observers first so nothing is counted for nobody."""
+    for observer in observers:
+        observer.count(**counts)
+
+
+def enable_metrics(callback=None):
+    """Start timing and counting every tagging call, returning the Metrics which holds the totals.
+
+    callback, if given, is called with a dict describing each call as it finishes."""
+    metrics = Metrics(callback, {'normalize_form': normalize_form, 'oov_vector': oov_vector})
+    observers.append(metrics)
+    return metrics
+
+
+def disable_metrics(metrics):
+    """Stop a Metrics from enable_metrics() from seeing any more calls."""
+    observers.remove(metrics)
+
+
+@contextlib.contextmanager
+def profiling(path, tensorflow=False):
+    """Record every tagging call made inside the block and write the spans to path as a Chrome trace JSON file.
+
+    Open the file in chrome://tracing or ui.perfetto.dev. Each phase and each aspect's model calls get their own span
+    holding the array shapes and padded batch sizes. With tensorflow=True, TensorFlow's own profile of the same calls,
+    annotated with those spans, is written to a folder next to path for TensorBoard's profile tab."""
+    profiler = Profiler(tensorflow)
+    if tensorflow:
+        tf.profiler.experimental.start(f'{os.path.splitext(path)[0]}.tensorflow')
+    observers.append(profiler)
+    try:
+        yield profiler
+    finally:
+        observers.remove(profiler)
+        if tensorflow:
+            tf.profiler.experimental.stop()
+        profiler.write(path)
+
+
+def load_stage(weights, title, stage):
+    """Load one model and return it along with the seconds it took."""
+    start_time = time.perf_counter()
+    if weights is not None:
+        model = weights.load(f'{title}-{stage}')
+    else:
+        model = load_model(os.path.join(model_folder, model_files[title][('lstm1', 'dnn', 'lstm2').index(stage)]))
+    return model, time.perf_counter() - start_time
+
+
+def model_weights():
+    """Return what models load from: exported SavedModels, else the packed weights file, else None for HDF5 files."""
+    if saved_models_path and os.path.isfile(os.path.join(saved_models_path, 'config.json')):
+        return SavedModels(saved_models_path)
+    if weights_path and os.path.isfile(weights_path):
+        return WeightsFile(weights_path)
+    return None
+
+
+def create_morph_classes(aspects=None, workers=None):
+    """Create a class instance for each part of speech aspect.
+
+    Every aspect needs its LSTM1 and DNN since the DNN takes in all of the LSTM1 outputs. LSTM2 is only loaded for the
+    aspects listed in aspects, or for all of them by default. Any other LSTM2 waits until something asks for it.
+
+    Models exported by export_models() are used first if there are any, then the single weights file written by
+    pack_model_weights(), and otherwise the HDF5 files.
+    Models are loaded on a pool of worker threads, angel.model_load_workers by default. Each aspect's load_seconds
+    holds how long each of its models took."""
+    weights = model_weights()
+
+    # Start every model loading at once and let the pool work through them
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or model_load_workers) as pool:
+        loads = {}
+        for title in morph_tags:
+            stages = ('lstm1', 'dnn', 'lstm2') if aspects is None or title in aspects else ('lstm1', 'dnn')
+            for stage in stages:
+                loads[(title, stage)] = pool.submit(load_stage, weights, title, stage)
+
+        morphs = []
+        for title, tags in morph_tags.items():
+            models = {stage: loads[(title, stage)].result() for stage in ('lstm1', 'dnn', 'lstm2')
+                      if (title, stage) in loads}
+            lstm2 = models['lstm2'][0] if 'lstm2' in models else None
+            print(f'{"Part-of-speech" if title == "pos" else title.capitalize()} models loaded: ' +
+                  ', '.join(f'{stage.upper()} {seconds:.02f}s' for stage, (_, seconds) in models.items()))
+
+            # Create a class instance for each aspect of morphology
+            aspect = Morphs(title, tags, models['lstm1'][0], models['dnn'][0], lstm2,
+                            os.path.join(model_folder, model_files[title][2]), weights)
+            aspect.load_seconds = {stage: seconds for stage, (_, seconds) in models.items()}
+            morphs.append(aspect)
+
+    print(f'Loaded {len(loads)} models in {time.perf_counter() - start_time:.02f}s.')
+    return tuple(morphs)
+
+
+def load_hdf5_models():
+    """Load all 27 HDF5 models into a dict keyed by names like pos-lstm1."""
+    models = {}
+    for title in morph_tags:
+        for stage, model_file in zip(('lstm1', 'dnn', 'lstm2'), model_files[title]):
+            print(f'Reading {model_file}...')
+            models[f'{title}-{stage}'] = load_model(os.path.join(model_folder, model_file))
+    return models
+
+
+def pack_model_weights(path=None):
+    """Pack the weights of all 27 HDF5 models into one aligned, uncompressed file which can be memory-mapped."""
+    path = path or weights_path
+
+    # Write to a temporary file first so a half-written file is never picked up
+    write_weights_file(load_hdf5_models(), f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+
+
+def export_models(path=None, buckets=default_buckets, fused=False):
+    """Export every model as a SavedModel with a fixed signature for each batch size in buckets.
+
+    create_morph_classes() then loads these and runs each signature once, so the first text tagged after a restart
+    doesn't pay for tracing. fused=True exports each stage once with all nine aspects in one graph."""
+    path = path or saved_models_path
+    export_saved_models(load_hdf5_models(), path, buckets, fused)
+
+
+def downloaded_model_files():
+    """List the files every model archive and mirror provides, leaving out anything made locally from them."""
+    return ['fasttext.wordvectors'] + [model_file for stage_files in model_files.values() for model_file in stage_files]
+
+
+def required_model_files():
+    """List the files the tagger can't run without.
+
+    A compact_vectors folder made by compact_word_vectors() stands in for the FastText vectors. It is never in a
+    manifest, so models_installed() only checks that it is there."""
+    required_files = downloaded_model_files()
+    if os.path.isdir(os.path.join(model_folder, 'compact_vectors')):
+        required_files[0] = 'compact_vectors/config.json'
+    return required_files
+
+
+def download_models(source=None, components=None, verify=False):
+    """Install the models in model_folder from a mirror, only fetching what is missing.
+
+    source defaults to angel.model_source. components limits a mirror install to some components, e.g. ['vectors',
+    'pos-lstm1']. verify=True checks every installed file's checksum and fetches any damaged ones again. The original
+    Google Drive archive and tar archives without a manifest are always unpacked whole."""
+    source = source or model_source
+    if 'drive.google.com' in source:
+        # Download next to the model folder, not into the working directory. gdown picks up an interrupted download.
+        archive = f'{model_folder}.tar.xz'
+        print('Downloading models...')
+        gdown.download(source, archive, quiet=False, resume=True)
+        print(f'Unpacking models to {model_folder}...')
+        install_archive(model_folder, archive, downloaded_model_files())
+        os.remove(archive)
+    elif os.path.isfile(source) and fetch_source_manifest(source) is None:
+        print(f'Unpacking models to {model_folder}...')
+        install_archive(model_folder, source, downloaded_model_files())
+    else:
+        install_models(model_folder, source, components, verify=verify)
 
 
 def elision_normalize(s):
     """Turn unicode characters which look similar to 2019 into 2019."""
-    return s.replace("\u02BC", "\u2019").replace("\u1FBF", "\u2019").replace("\u0027", "\u2019").\
-        replace("\u1FBD", "\u2019")
+    return s.translate(elision_table)
+
+
+@lru_cache(maxsize=2**18)
+def normalize_form(token):
+    """Return the normalized form of a token, remembering it since Greek text repeats the same forms heavily."""
+
+    # Punctuation and numbers have nothing to normalize, and neither does a lowercase word with a single acute or
+    # circumflex which isn't elided
+    if inert_pattern.fullmatch(token):
+        return token
+    if settled_word_pattern.fullmatch(token) and token not in ELISION and token not in MOVABLE:
+        return token
+    return normalise(elision_normalize(token))[0]
+
+
+def normalize_tokens(split_text):
+    """Return the normalized form of each token."""
+    return [normalize_form(token) for token in split_text]
 
 
 def isolate_greek_punctuation(fsentence):
@@ -113,6 +367,26 @@ def isolate_greek_punctuation(fsentence):
         replace('‘', ' ‘ ')
 
 
+def tokenize(greek_text):
+    """Split text into words and punctuation in one pass, returning the tokens and their (start, end) offsets."""
+    tokens = []
+    offsets = []
+    for match in token_pattern.finditer(greek_text):
+        tokens.append(match.group())
+        offsets.append(match.span())
+    return tokens, offsets
+
+
+def load_word_vectors(folder, mmap='r'):
+    """Load the compact word vector store if one has been made, otherwise the full gensim FastText vectors.
+
+    The vector arrays are memory-mapped read-only by default, so every tagger process on a machine shares the one copy
+    in the page cache. Pass mmap=None to read them into private memory instead."""
+    if os.path.isdir(os.path.join(folder, 'compact_vectors')):
+        return CompactVectors.load(os.path.join(folder, 'compact_vectors'), mmap_mode=mmap)
+    return KeyedVectors.load(os.path.join(folder, 'fasttext.wordvectors'), mmap=mmap)
+
+
 def vector_lookup(gword):
     """Return a vector for a given Greek word."""
     try:
@@ -121,15 +395,41 @@ def vector_lookup(gword):
         return np.array([0]*100)
 
 
-def tag(greek_text, annotator='Vanessa Gorman'):
-    """Take in a string of Greek text and return that text morphologically tagged."""
-    print('Loading models...')
-    pos, person, number, tense, mood, voice, gender, case, degree = create_morph_classes()
-    morphs = (pos, person, number, tense, mood, voice, gender, case, degree)
+@lru_cache(maxsize=2**16)
+def oov_vector(gword):
+    """Return the vector FastText builds out of the character n-grams of a word it never saw, remembering it."""
+    return vector_lookup(gword)
+
 
-    # Create the normalizer
-    normalise = Normaliser().normalise
+def lookup_vectors(normalized_forms):
+    """Return the vectors of a whole list of normalized tokens as one array, looking up each unique form only once."""
 
+    # Give each unique form a row
+    form_rows = {}
+    rows = [form_rows.setdefault(form, len(form_rows)) for form in normalized_forms]
+    vectors = np.zeros((len(form_rows), 100), dtype=np.float32)
+
+    # Known words come straight out of the vector matrix. The rest are built from their n-grams.
+    known_rows = []
+    known_indices = []
+    for row, form in enumerate(form_rows):
+        index = wv.key_to_index.get(form)
+        if index is None:
+            vectors[row] = oov_vector(form)
+        else:
+            known_rows.append(row)
+            known_indices.append(index)
+    vectors[known_rows] = wv.vectors[known_indices]
+
+    if observers:
+        known = np.zeros(len(form_rows), dtype=bool)
+        known[known_rows] = True
+        count(vector_lookups=len(rows), oov_tokens=int(len(rows) - known[rows].sum()))
+    return vectors[rows]
+
+
+def create_annotator_tensor(annotator):
+    """Return the one-hot tensor for the annotator the tagger should imitate."""
     # Create annotator tensor
     annotator_tensor = [0] * 37
     try:
@@ -139,26 +439,19 @@ def tag(greek_text, annotator='Vanessa Gorman'):
     except IndexError:
         annotator_tensor[0] = 1
 
-    print('Pre-processing text...')
+    return annotator_tensor
+
+
+def one_hot_tokens(normalized_forms, annotator_tensor):
+    """Turn a list of normalized tokens into an array of one-hot character tensors for LSTM1."""
     blank_character_tensor = np.array([0]*174, dtype=np.float32)
-    punc_separated_text = isolate_greek_punctuation(greek_text)
-    split_text = punc_separated_text.split()
-    print(f'Text and punctuation split into {len(split_text)} individual tokens.')
     one_hotted_tokens = []
-    dnn_input = []
-    blank_lstm2_token = np.array([0]*192)
-    lstm2_padding = np.tile(blank_lstm2_token, (7, 1))
-    lstm2_input = []
-    return_list = []
 
     # Create character tensors and word tensors composed of those character tensors
-    for word in split_text:
+    for normalized_form in normalized_forms:
 
         # The whole token tensor starts out blank because it's challenging to fill out the empty characters.
         token_tensor = np.array([blank_character_tensor]*21, dtype=np.float32)
-
-        # Normalize each token before tensorizing its characters.
-        normalized_form = normalise(elision_normalize(word))[0]
         token_length = len(normalized_form)
 
         # Create token tensors for tokens longer than 21 characters
@@ -213,74 +506,437 @@ def tag(greek_text, annotator='Vanessa Gorman'):
         one_hotted_tokens.append(token_tensor)
     one_hots_np = np.array(one_hotted_tokens, dtype=np.float32)
 
-    # Process through the first LSTM...
-    print("Angel's looking at each word by itself...")
-    for aspect in morphs:
-        aspect.output1 = aspect.lstm1.predict(one_hots_np)
+    if observers:
+        encoded_forms = [form if len(form) <= 21 else form[:10] + form[-10:] for form in normalized_forms]
+        count(truncated_tokens=sum(len(form) > 21 for form in normalized_forms),
+              characters=sum(len(form) for form in encoded_forms),
+              other_characters=sum(character not in norm_character_set for form in encoded_forms
+                                   for character in form))
 
-    for aspect in morphs:
-        for tensor in aspect.output1:
-            try:
-                aspect.predicted_tags1.append(aspect.tags[int(np.argmax(tensor))])
-            except IndexError:
-                aspect.predicted_tags1.append('-')
-            aspect.confidence1.append(np.amax(tensor))
+    return one_hots_np
 
-    for i, token in enumerate(punc_separated_text.split()):
-        dnn_input.append(np.concatenate((pos.output1[i], person.output1[i], number.output1[i], tense.output1[i],
-                                        mood.output1[i], voice.output1[i], gender.output1[i], case.output1[i],
-                                        degree.output1[i], annotator_tensor), axis=0))
-    np_dnn_input = np.array(dnn_input)
 
-    # Run outputs through DNN
-    print('Reconsidering tags...')
+def context_windows(lstm2_input, start, stop):
+    """Return the 15 token LSTM2 windows centred on tokens start through stop - 1, with blanks past either end."""
+    first_row, last_row = max(start-7, 0), min(stop+7, len(lstm2_input))
+    padded_lstm2_input = np.concatenate((np.zeros((7-(start-first_row), 192), dtype=np.float32),
+                                         lstm2_input[first_row:last_row],
+                                         np.zeros((stop+7-last_row, 192), dtype=np.float32)))
+    return padded_lstm2_input[np.arange(stop-start)[:, None] + np.arange(15)]
+
+
+def encode_tokens(normalized_forms, bounds, annotators):
+    """One-hot encode the tokens of each document for LSTM1, each with its own annotator.
+
+    Document i holds tokens bounds[i] through bounds[i+1] - 1. Returns the LSTM1 input along with every token's
+    annotator tensor, which the DNN and LSTM2 inputs end with."""
+    one_hots = [np.zeros((0, 21, 174), dtype=np.float32)]
+    annotator_rows = [np.zeros((0, 37), dtype=np.float32)]
+    for start, stop, annotator in zip(bounds[:-1], bounds[1:], annotators):
+        if stop > start:
+            annotator_tensor = create_annotator_tensor(annotator)
+            one_hots.append(one_hot_tokens(normalized_forms[start:stop], annotator_tensor))
+            annotator_rows.append(np.tile(np.array(annotator_tensor, dtype=np.float32), (stop - start, 1)))
+    return np.concatenate(one_hots), np.concatenate(annotator_rows)
+
+
+def run_stage(morphs, stage, inputs):
+    """Run the lstm1, dnn, or lstm2 model of every aspect on the same inputs, returning each aspect's output."""
+    outputs = []
     for aspect in morphs:
-        aspect.output2 = aspect.dnn.predict(np_dnn_input)
+        with observe(stage, aspect.title, shape=inputs.shape):
+            outputs.append(run_model(getattr(aspect, stage), inputs))
+    return outputs
+
 
+def dnn_input_rows(output1, annotator_rows):
+    """Return each token's DNN input: every aspect's LSTM1 output, then the annotator tensor."""
+    return np.concatenate(output1 + [annotator_rows], axis=1)
+
+
+def lstm2_input_rows(output2, annotator_rows, vectors):
+    """Return each token's LSTM2 input: every aspect's DNN output, then the annotator tensor and the word vector."""
+    return np.concatenate(output2 + [annotator_rows, vectors], axis=1)
+
+
+def document_windows(lstm2_input, bounds):
+    """Return the LSTM2 windows of every token, with each document padded by blanks so none sees another's tokens."""
+    return np.concatenate([np.zeros((0, 15, 192), dtype=np.float32)] +
+                          [context_windows(lstm2_input[start:stop], 0, stop - start)
+                           for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start])
+
+
+def splice(array, start, stop, new_rows):
+    """Replace rows start through stop - 1 of an array, in place if the number of rows stays the same."""
+    if len(new_rows) == stop - start:
+        array[start:stop] = new_rows
+        return array
+    return np.concatenate((array[:start], new_rows, array[stop:]))
+
+
+def run_model(model, inputs):
+    """Run a model on a batch, skipping the overhead of predict().
+
+    Batches are padded up to a power of two so that a new batch size doesn't make TensorFlow retrace the model, and
+    anything over 1024 rows runs 1024 at a time. Exported SavedModels already have fixed batch signatures, so they're
+    left to pad for themselves."""
+    if isinstance(model, (SavedStage, FusedOutput)):
+        return model.predict(inputs)
+    if len(inputs) > 1024:
+        return np.concatenate([run_model(model, inputs[start:start+1024]) for start in range(0, len(inputs), 1024)])
+    batch_size = max(2**int(np.ceil(np.log2(max(len(inputs), 1)))), 16)
+    padding = np.zeros((batch_size - len(inputs),) + inputs.shape[1:], dtype=np.float32)
+    with observe('model_batch', rows=len(inputs), batch_size=batch_size):
+        return np.array(model.predict_on_batch(np.concatenate((inputs, padding))))[:len(inputs)]
+
+
+def run_model_rows(model, inputs, rows):
+    """Run a model on only some rows of inputs.
+
+    A fused SavedModel is handed the whole array, so that when every aspect asks for its own rows of the same inputs
+    the fused graph still only runs once on each row."""
+    if isinstance(model, FusedOutput):
+        return model.predict_rows(inputs, rows)
+    return run_model(model, inputs[rows])
+
+
+@observed
+def predict_morphs(split_text, morphs, annotator='Vanessa Gorman', cascade=False, pos_gate=False, aspects=None,
+                   refine=False, normalized=None):
+    """Run a list of tokens through all three stages, filling in the outputs of each aspect of morphology.
+
+    Only the aspects listed in aspects, or all of them by default, go through LSTM2. The rest are tagged '-'.
+    normalized may hold the already normalized form of each token, in which case no normalization is done."""
+
+    # Get per-aspect confidence thresholds if the cascade is turned on
+    thresholds = {aspect.title: None for aspect in morphs}
+    if cascade:
+        thresholds.update(cascade_thresholds)
+        if isinstance(cascade, dict):
+            thresholds.update(cascade)
+
+    # Clear out anything left over from a previous run
     for aspect in morphs:
-        for tensor in aspect.output2:
-            try:
-                aspect.predicted_tags2.append(aspect.tags[int(np.argmax(tensor))])
-            except IndexError:
-                aspect.predicted_tags2.append('-')
-            aspect.confidence2.append(np.amax(tensor))
+        aspect.predicted_tags1 = []
+        aspect.predicted_tags2 = []
+        aspect.predicted_tags3 = []
+        aspect.confidence1 = []
+        aspect.confidence2 = []
+        aspect.confidence3 = []
+        aspect.lstm2_windows = 0
+        aspect.dnn_rows = 0
+    pos = morphs[0]
 
-    # Prepare inputs for LSTM2
-    for i, token in enumerate(punc_separated_text.split()):
-        lstm2_input.append(np.concatenate((pos.output2[i], person.output2[i], number.output2[i], tense.output2[i],
-                                           mood.output2[i], voice.output2[i], gender.output2[i], case.output2[i],
-                                           degree.output2[i], annotator_tensor,
-                                           vector_lookup(normalise(elision_normalize(token))[0])), axis=0))
+    if observers:
+        count(tokens=len(split_text))
 
-    padded_lstm2_input = np.concatenate((lstm2_padding, lstm2_input, lstm2_padding))
+    # Normalize each token once, unless that has already been done
+    if normalized is None:
+        with observe('normalization'):
+            normalized = normalize_tokens(split_text)
 
-    time_series = []
-    for i in range(0, len(padded_lstm2_input)-14):
-        time_series.append(padded_lstm2_input[i:i+15])
+    annotator_tensor = create_annotator_tensor(annotator)
+    bounds = [0, len(split_text)]
+    with observe('encoding'):
+        one_hots, annotator_rows = encode_tokens(normalized, bounds, [annotator])
 
-    lstm2_ts = np.array(time_series)
+    # Process through the first LSTM...
+    print("Angel's looking at each word by itself...")
+    output1 = run_stage(morphs, 'lstm1', one_hots)
+    with observe('decoding'):
+        for aspect, aspect_output1 in zip(morphs, output1):
+            aspect.output1 = aspect_output1
+            aspect.predicted_tags1, aspect.confidence1 = decode_output(aspect, aspect.output1)
 
-    # In the future, convert to a tf.data format:
-    # dataset = tf.data.Dataset.from_tensor_slices(padded_lstm2_input).window(15, 1, 1)
+    # Run outputs through DNN
+    print('Reconsidering tags...')
+    output2 = run_stage(morphs, 'dnn', dnn_input_rows(output1, annotator_rows))
+    with observe('decoding'):
+        for aspect, aspect_output2 in zip(morphs, output2):
+            aspect.output2 = aspect_output2
+            aspect.dnn_rows = len(one_hots)
+            aspect.predicted_tags2, aspect.confidence2 = decode_output(aspect, aspect.output2)
+
+    # Prepare inputs for LSTM2
+    with observe('vectors'):
+        vectors = lookup_vectors(normalized)
+    with observe('lstm2_windowing'):
+        lstm2_input = lstm2_input_rows(output2, annotator_rows, vectors)
+        lstm2_ts = document_windows(lstm2_input, bounds)
 
     # Run outputs through LSTM2
     print("Studying each word in light of its context...")
+    if aspects is None:
+        aspects = [aspect.title for aspect in morphs]
     for aspect in morphs:
-        aspect.output3 = aspect.lstm2.predict(lstm2_ts)
 
-    for aspect in morphs:
-        for tensor in aspect.output3:
-            try:
-                aspect.predicted_tags3.append(aspect.tags[int(np.argmax(tensor))])
-            except IndexError:
-                aspect.predicted_tags3.append('-')
-            aspect.confidence3.append(np.amax(tensor))
+        # Unrequested aspects never touch their LSTM2. Part-of-speech is still needed if it's gating the rest.
+        if aspect.title not in aspects and not (pos_gate and aspect is pos):
+            aspect.output3 = run_lstm2(aspect, lstm2_ts, carriers=np.zeros(len(lstm2_ts), dtype=bool))
+
+        # Only look at tokens whose part-of-speech can carry this aspect
+        elif pos_gate and aspect is not pos:
+            carriers = np.isin(predicted_pos, [pos.tags.index(pos_tag) for pos_tag in pos_carriers[aspect.title]])
+            with observe('lstm2', aspect.title, shape=lstm2_ts.shape):
+                aspect.output3 = run_lstm2(aspect, lstm2_ts, thresholds[aspect.title], carriers)
+        else:
+            with observe('lstm2', aspect.title, shape=lstm2_ts.shape):
+                aspect.output3 = run_lstm2(aspect, lstm2_ts, thresholds[aspect.title])
+
+        # Part-of-speech comes first, so it is settled before any other aspect gets here
+        if pos_gate and aspect is pos:
+            predicted_pos = np.argmax(pos.output3, axis=1)
+
+    if cascade or pos_gate or len(aspects) < len(morphs):
+        windows_run = sum(aspect.lstm2_windows for aspect in morphs)
+        windows_total = len(lstm2_ts) * len(morphs)
+        print(f'Skipped {windows_total - windows_run} of {windows_total} LSTM2 windows.')
+
+    if refine:
+        print('Reconsidering tags in order of confidence...')
+        max_iterations = refine_max_iterations if refine is True else refine
+        with observe('refine'):
+            iterations = refine_morphs(morphs, annotator_tensor, lstm2_input, aspects, max_iterations)
+        print(f'Refinement finished after {iterations} iterations.')
+
+    with observe('decoding'):
+        for aspect in morphs:
+            aspect.predicted_tags3, aspect.confidence3 = decode_output(aspect, aspect.output3)
+
+    return morphs
+
+
+def tag_index_array(aspect, output):
+    """Return the index into aspect.tags of each row's most likely tag, where len(aspect.tags) stands for '-'."""
+    return np.minimum(np.argmax(output, axis=1), len(aspect.tags))
+
+
+def decode_output(aspect, output):
+    """Return each row's most likely tag and its confidence as NumPy arrays."""
+    output = np.asarray(output)
+    return np.array(aspect.tags + ('-',))[tag_index_array(aspect, output)], np.amax(output, axis=1)
+
+
+def result_arrays(morphs, outputs):
+    """Return the index of each aspect's most likely tag in outputs and its confidence, as a TaggedTokens holds them."""
+    tag_indices = np.stack([tag_index_array(aspect, output) for aspect, output in zip(morphs, outputs)], axis=1)
+    confidences = np.stack([np.amax(output, axis=1) for output in outputs], axis=1)
+    return tag_indices.astype(np.uint8), confidences.astype(np.float32)
+
+
+def decode_results(tokens, morphs, outputs):
+    """Return tokens as a TaggedTokens holding each aspect's most likely tag in outputs and its confidence."""
+    return TaggedTokens.from_tokens(tokens, *result_arrays(morphs, outputs),
+                                    {aspect.title: aspect.tags for aspect in morphs})
+
+
+def run_lstm2(aspect, lstm2_ts, threshold=None, carriers=None):
+    """Run LSTM2 for one aspect, skipping any window whose centre token's tag is already settled.
+
+    Tokens the DNN is at least threshold confident about keep their stage 2 output. When carriers is given, only the
+    tokens it marks True are considered and the rest are tagged '-'. Every window run still sees its full context."""
+    if threshold is None and carriers is None:
+        aspect.lstm2_windows = len(lstm2_ts)
+        aspect.lstm2_skipped = np.zeros(len(lstm2_ts), dtype=bool)
+        return run_model(aspect.lstm2, lstm2_ts)
+
+    output3 = np.array(aspect.output2, dtype=np.float32)
+    needed = np.ones(len(output3), dtype=bool)
+    if threshold is not None:
+        needed &= np.amax(output3, axis=1) < threshold
+
+    # The last slot of every output is the '-' tag
+    if carriers is not None:
+        output3[~carriers] = 0
+        output3[~carriers, -1] = 1
+        needed &= carriers
 
-    for i, token in enumerate(punc_separated_text.split()):
-        return_list.append((token, pos.predicted_tags3[i] + person.predicted_tags3[i] + number.predicted_tags3[i] +
-                            tense.predicted_tags3[i] + mood.predicted_tags3[i] + voice.predicted_tags3[i] +
-                            gender.predicted_tags3[i] + case.predicted_tags3[i] + degree.predicted_tags3[i]))
-    return tuple(return_list)
+    aspect.lstm2_skipped = ~needed
+    needed = np.flatnonzero(needed)
+    if len(needed) > 0:
+        output3[needed] = run_model_rows(aspect.lstm2, lstm2_ts, needed)
+    aspect.lstm2_windows = len(needed)
+    return output3
+
+
+def refine_morphs(morphs, annotator_tensor, lstm2_input, aspects, max_iterations):
+    """Lock in the most confident LSTM2 decisions and reconsider the tokens around them, returning the iterations run.
+
+    Each iteration accepts undecided tags in order of confidence as long as the 7 token windows around them don't
+    overlap, and sets them to one-hot. The tokens in those windows go back through the DNN using the current LSTM2
+    outputs as input. Then only the LSTM2 windows which contain one of those tokens and are still undecided are run
+    again, all in one batch per aspect. This stops when every tag is decided, when an iteration changes no undecided
+    tag, or after max_iterations."""
+    token_count = len(lstm2_input)
+    refined = [aspect for aspect in morphs if aspect.title in aspects]
+
+    # Windows are cut straight out of the input padded with 7 blanks on either end, which is updated as tokens change
+    blanks = np.zeros((7, lstm2_input.shape[1]), dtype=np.float32)
+    padded_lstm2_input = np.concatenate((blanks, lstm2_input, blanks))
+
+    # Where each aspect's output sits within a token's DNN and LSTM2 inputs
+    starts = np.cumsum([0] + [len(aspect.tags) + 1 for aspect in morphs])
+
+    # Tags that LSTM2 never had to look at are already decided
+    decided = {aspect.title: np.array(aspect.lstm2_skipped, dtype=bool) for aspect in refined}
+    annotator_tensors = np.array(annotator_tensor, dtype=np.float32)
+
+    for iteration in range(max_iterations):
+
+        # Rank every undecided tag by how confident LSTM2 is about it
+        candidates = []
+        for aspect in refined:
+            undecided = np.flatnonzero(~decided[aspect.title])
+            confidence = np.amax(aspect.output3[undecided], axis=1) if len(undecided) > 0 else []
+            candidates += zip(confidence, undecided, [aspect]*len(undecided))
+        if not candidates:
+            return iteration
+        candidates.sort(key=lambda candidate: -candidate[0])
+
+        # Accept tags until every remaining one's window would overlap with a window already accepted
+        reconsidered = np.zeros(token_count, dtype=bool)
+        dirty_windows = np.zeros(token_count, dtype=bool)
+        for confidence, i, aspect in candidates:
+            window = slice(max(i-7, 0), i+8)
+            if reconsidered[window].any():
+                continue
+            reconsidered[window] = True
+
+            # Any LSTM2 window holding a reconsidered token needs to be run again
+            dirty_windows[max(i-14, 0):i+15] = True
+            one_hot = np.zeros_like(aspect.output3[i])
+            one_hot[np.argmax(aspect.output3[i])] = 1
+            aspect.output3[i] = one_hot
+            decided[aspect.title][i] = True
+        dirty_tokens = np.flatnonzero(reconsidered)
+
+        # Run the reconsidered tokens back through the DNN
+        dnn_input = dnn_input_rows([aspect.output3[dirty_tokens] if aspect in refined else aspect.output2[dirty_tokens]
+                                    for aspect in morphs], np.tile(annotator_tensors, (len(dirty_tokens), 1)))
+        for k, aspect in enumerate(morphs):
+            dnn_output = run_model(aspect.dnn, dnn_input)
+            aspect.dnn_rows += len(dirty_tokens)
+
+            # Decided tags stay one-hot in the context LSTM2 sees
+            if aspect in refined:
+                locked = decided[aspect.title][dirty_tokens]
+                dnn_output[locked] = aspect.output3[dirty_tokens[locked]]
+            padded_lstm2_input[dirty_tokens + 7, starts[k]:starts[k+1]] = dnn_output
+
+        # Every aspect's windows are cut out together, so a fused LSTM2 runs each of them once
+        changed = False
+        all_decided = np.logical_and.reduce([decided[aspect.title] for aspect in refined])
+        all_windows = np.flatnonzero(dirty_windows & ~all_decided)
+        lstm2_ts = padded_lstm2_input[all_windows[:, None] + np.arange(15)]
+        for aspect in refined:
+            rows = np.flatnonzero(~decided[aspect.title][all_windows])
+            windows = all_windows[rows]
+            if len(windows) > 0:
+                output3 = run_model_rows(aspect.lstm2, lstm2_ts, rows)
+                changed = changed or np.any(np.argmax(output3, axis=1) != np.argmax(aspect.output3[windows], axis=1))
+                aspect.output3[windows] = output3
+                aspect.lstm2_windows += len(windows)
+        if not changed:
+            return iteration + 1
+
+    return max_iterations
+
+
+@observed
+def tag_documents(documents, morphs, annotators=None):
+    """Tag several already split documents together, running each stage once over all of their tokens.
+
+    Each document gets its own LSTM2 windows with blanks past either end, just as it would if it were tagged alone, so
+    no document sees the tokens of another. annotators may give one annotator per document. Returns a list holding a
+    tuple of (token, tag) pairs for each document.
+    It runs its stages through the same helpers as predict_morphs(), but has none of its options, and never stores
+    anything on morphs, so several threads can share them."""
+    annotators = annotators or ['Vanessa Gorman'] * len(documents)
+    bounds = np.cumsum([0] + [len(document) for document in documents])
+    if bounds[-1] == 0:
+        return [() for _ in documents]
+
+    # Build every stage's input document by document, then run the models over all of them at once
+    tokens = [token for document in documents for token in document]
+    if observers:
+        count(tokens=len(tokens))
+    with observe('normalization', tokens=len(tokens), documents=len(documents)):
+        normalized = normalize_tokens(tokens)
+    with observe('encoding'):
+        one_hots, annotator_rows = encode_tokens(normalized, bounds, annotators)
+    output1 = run_stage(morphs, 'lstm1', one_hots)
+    output2 = run_stage(morphs, 'dnn', dnn_input_rows(output1, annotator_rows))
+    with observe('vectors'):
+        vectors = lookup_vectors(normalized)
+    with observe('lstm2_windowing'):
+        windows = document_windows(lstm2_input_rows(output2, annotator_rows, vectors), bounds)
+    output3 = run_stage(morphs, 'lstm2', windows)
+
+    with observe('decoding'):
+        results = decode_results(tokens, morphs, output3)
+        return [tuple(results[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+@observed
+def tag_tokens(tokens, normalized=None, annotator='Vanessa Gorman', cascade=False, pos_gate=False, aspects=None,
+               refine=False):
+    """Take in a list of already split Greek tokens and return them morphologically tagged, as a TaggedTokens.
+
+    If normalized holds the normalized form of each token, the tokens are not normalized again. The other options are
+    the same as for tag()."""
+    tag_indices, confidences = tag_token_arrays(tokens, normalized, annotator, cascade, pos_gate, aspects, refine)
+    return TaggedTokens.from_tokens(tokens, tag_indices, confidences, morph_tags)
+
+
+def tag_token_arrays(tokens, normalized, annotator, cascade, pos_gate, aspects, refine):
+    """Tag already split tokens for tag() and tag_tokens(), returning only the arrays a TaggedTokens is built from.
+
+    Each caller builds its one result from these, with the offsets it has."""
+    if normalized is not None and len(normalized) != len(tokens):
+        raise ValueError(f'Got {len(normalized)} normalized forms for {len(tokens)} tokens.')
+    if aspects is not None:
+        unknown_aspects = [title for title in aspects if title not in morph_tags]
+        if unknown_aspects:
+            raise ValueError(f'Unknown aspects {unknown_aspects}. Choose from {list(morph_tags)}.')
+
+    print('Loading models...')
+    with observe('load_models'):
+        morphs = create_morph_classes(aspects)
+    predict_morphs(tokens, morphs, annotator, cascade, pos_gate, aspects, refine, normalized)
+
+    with observe('decoding'):
+        return result_arrays(morphs, [aspect.output3 for aspect in morphs])
+
+
+@observed
+def tag(greek_text, annotator='Vanessa Gorman', cascade=False, pos_gate=False, aspects=None, refine=False,
+        offsets=False, profile=None):
+    """Take in a string of Greek text and return that text morphologically tagged.
+
+    The result is a TaggedTokens, which reads like a tuple of (token, tag) pairs but holds its tags and confidences in
+    arrays, and can pick out tokens by tag, e.g. result.where(pos='v', mood='s').
+
+    Setting cascade to True skips LSTM2 for any aspect of a token whose DNN confidence is already above the
+    threshold in cascade_thresholds. A dict of aspect titles to thresholds may be given to override those values.
+    The cascade is experimental, since the default thresholds are not yet calibrated.
+    Setting pos_gate to True tags part-of-speech first and then only runs each other aspect on tokens whose
+    part-of-speech can carry it, as listed in pos_carriers. Everything else gets '-' for that aspect.
+    Passing a list of aspect titles (e.g. ['pos', 'case']) as aspects only loads and runs LSTM2 for those aspects.
+    The rest are tagged '-'.
+    Setting refine to True locks in tags in order of confidence and reconsiders the context around each one, for up to
+    refine_max_iterations rounds. An int may be given instead to set the number of rounds.
+    Setting offsets to True adds each token's start and end character offsets in greek_text to its tuple.
+    Passing a file path as profile writes a Chrome trace of the call there, as profiling() does."""
+    if profile is not None:
+        with profiling(profile):
+            return tag(greek_text, annotator, cascade, pos_gate, aspects, refine, offsets)
+    print('Pre-processing text...')
+    with observe('tokenization'):
+        split_text, token_offsets = tokenize(greek_text)
+    print(f'Text and punctuation split into {len(split_text)} individual tokens.')
+    tag_indices, confidences = tag_token_arrays(split_text, None, annotator, cascade, pos_gate, aspects, refine)
+    return TaggedTokens(greek_text, np.array(token_offsets, dtype=np.int64).reshape(-1, 2), tag_indices, confidences,
+                        morph_tags, with_offsets=offsets)
 
 
 # This will keep Tensorflow quieter.
@@ -295,6 +951,7 @@ all_norm_characters = ("ζ", "ε", "ύ", "ς", "μ", "έ", "ν", "ἀ", "φ", "
                        "ᾔ", "?", " ", "\"", "ᾠ", "ἷ", "ὥ", "ᾖ", "ᾤ", "ῴ", "ὗ", "ϊ", "ᾇ", "ᾧ", "(", ")", "ᾁ", "ᾗ",
                        "ᾴ", "ᾡ", "ᾐ", "ᾑ", "ΰ", "ᾀ", "ᾕ", "ᾆ", "†", "¯", "̆", "ᾄ", ">", "ϋ", "ῗ", "ᾦ", "<", "2",
                        "0", "’", ":", "—", "（", "）", "ᾅ", "ῧ", "ϝ")
+norm_character_set = frozenset(all_norm_characters)
 all_annotators = ("Vanessa Gorman", "david.bamman", "david", "millermo2", "gleason", "Sean Stewart",
                   "Robert Gorman", "Francesco Mambrini", "Daniel Lim Libatique", "Alex Lessie", "James C. D'Amico",
                   "Brian Livingston", "Calliopi Dourou", "C. Dan Earley", "Connor Hayden", "Francis Hartel",
@@ -303,31 +960,112 @@ all_annotators = ("Vanessa Gorman", "david.bamman", "david", "millermo2", "gleas
                   "Scott J. Dube", "Tovah Keynton", "W. B. Dolan", "Florin Leonte", "Anthony D. Yates",
                   "Jordan Hawkesworth", "Giuseppe G. A. Celano", "Yoana Ivanova", "Polina Yordanova")
 
+# Normalization. Every token gets the same treatment, so one normalizer is shared.
+normalise = Normaliser().normalise
+elision_table = str.maketrans({'\u02BC': '\u2019', '\u1FBF': '\u2019', '\u0027': '\u2019', '\u1FBD': '\u2019'})
+inert_characters = ',·;.?!»«“”„()[]<>:‘’"-—–†0123456789'
+inert_pattern = re.compile(f'[{re.escape(inert_characters)}]+')
+
+# Normaliser leaves a word alone if it is already NFC, lowercase, and carries exactly one accent which isn't a grave,
+# since it only rewrites graves, second accents, capitals, and unaccented proclitics and enclitics. These are the
+# precomposed lowercase Greek letters without an accent and with one acute or circumflex.
+greek_letters = [character for character in map(chr, [*range(0x370, 0x400), *range(0x1F00, 0x2000)])
+                 if unicodedata.category(character) == 'Ll' and unicodedata.normalize('NFC', character) == character]
+greek_accents = '\u0300\u0301\u0342'
+letter_accents = {character: ''.join(mark for mark in unicodedata.normalize('NFD', character) if mark in greek_accents)
+                  for character in greek_letters}
+unaccented_letters = ''.join(character for character, accents in letter_accents.items() if not accents)
+accented_letters = ''.join(character for character, accents in letter_accents.items()
+                           if accents in ('\u0301', '\u0342'))
+settled_word_pattern = re.compile(f'[{unaccented_letters}]*[{accented_letters}][{unaccented_letters}]*')
+
+# Each punctuation mark is a token of its own. Everything else between whitespace and punctuation is a word.
+greek_punctuation = ',·;.?»«“„()><:‘'
+token_pattern = re.compile(f'[{re.escape(greek_punctuation)}]|[^\\s{re.escape(greek_punctuation)}]+')
+word_character_pattern = re.compile(f'[^\\s{re.escape(greek_punctuation)}]')
+
+# The possible tags for each aspect of morphology
+morph_tags = {'pos': ('l', 'n', 'a', 'r', 'c', 'i', 'p', 'v', 'd', 'm', 'g', 'u'),
+              'person': ('1', '2', '3'),
+              'number': ('s', 'p', 'd'),
+              'tense': ('p', 'i', 'r', 'l', 't', 'f', 'a'),
+              'mood': ('i', 's', 'n', 'm', 'p', 'o'),
+              'voice': ('a', 'p', 'm', 'e'),
+              'gender': ('m', 'f', 'n'),
+              'case': ('n', 'g', 'd', 'a', 'v'),
+              'degree': ('p', 'c', 's')}
+
+# The LSTM1, DNN, and LSTM2 model files for each aspect of morphology
+model_files = {'pos': ('pos-lstm1-3x128-0.927val0.939-AGDTfirst26last7.h5',
+                       'pos-dnn-2x20-0.939val0.942-AGDTfirst26last7.h5',
+                       'pos-lstm2-3x128-0.958val0.955-AGDTfirst26last7.h5'),
+               'person': ('person-lstm1-3x128-0.983val0.990-AGDTfirst26last7.h5',
+                          'person-dnn-2x20-0.994val0.992-AGDTfirst26last7.h5',
+                          'person-lstm2-3x128-0.994val0.994-AGDTfirst26last7.h5'),
+               'number': ('number-lstm1-3x128-0.955val0.980-AGDTfirst26last7.h5',
+                          'number-dnn-2x20-0.977val0.981-AGDTfirst26last7.h5',
+                          'number-lstm2-3x128-0.985val0.987-AGDTfirst26last7.h5'),
+               'tense': ('tense-lstm1-3x128-0.976val0.990-AGDTfirst26last7.h5',
+                         'tense-dnn-2x20-0.990val0.992-AGDTfirst26last7.h5',
+                         'tense-lstm2-3x128-0.986val0.992-AGDTfirst26last7.h5'),
+               'mood': ('mood-lstm1-3x128-0.981val0.992-AGDTfirst26last7.h5',
+                        'mood-dnn-2x20-0.994val0.992-AGDTfirst26last7.h5',
+                        'mood-lstm2-3x128-0.994val0.995-AGDTfirst26last7.h5'),
+               'voice': ('voice-lstm1-3x128-0.978val0.991-AGDTfirst26last7.h5',
+                         'voice-dnn-2x20-0.992val0.993-AGDTfirst26last7.h5',
+                         'voice-lstm2-3x128-0.989val0.993-AGDTfirst26last7.h5'),
+               'gender': ('gender-lstm1-3x128-0.923val0.934-AGDTfirst26last7.h5',
+                          'gender-dnn-2x20-0.952val0.937-AGDTfirst26last7.h5',
+                          'gender-lstm2-4x128-0.960val0.958-AGDTfirst26last7.h5'),
+               'case': ('case-lstm1-3x128-0.934val0.962-AGDTfirst26last7.h5',
+                        'case-dnn-2x20-0.957val0.963-AGDTfirst26last7.h5',
+                        'case-lstm2-2x128-0.975val0.977-AGDTfirst26last7.h5'),
+               'degree': ('degree-lstm1-3x128-0.998val0.999-AGDTfirst26last7.h5',
+                          'degree-dnn-2x20-0.999val0.999-AGDTfirst26last7.h5',
+                          'degree-lstm2-2x128-0.998val0.999-AGDTfirst26last7.h5')}
+
+# The DNN confidence an aspect needs before the cascade lets it skip LSTM2. These are an uncalibrated placeholder, which
+# is why the cascade is experimental. Calibrate them with preliminaries/13_testing_modes.py, and again whenever the
+# models are retrained.
+cascade_thresholds = {'pos': 0.99, 'person': 0.99, 'number': 0.99, 'tense': 0.99, 'mood': 0.99, 'voice': 0.99,
+                      'gender': 0.99, 'case': 0.99, 'degree': 0.99}
+
+# The most rounds of refinement tag(refine=True) will run
+refine_max_iterations = 10
+
+# How many models create_morph_classes() loads at once
+model_load_workers = min(4, os.cpu_count() or 1)
+
+# The parts-of-speech which can carry each aspect of morphology when pos_gate is on
+pos_carriers = {'person': ('v',), 'number': ('l', 'n', 'a', 'p', 'v', 'm'), 'tense': ('v',), 'mood': ('v',),
+                'voice': ('v',), 'gender': ('l', 'n', 'a', 'p', 'v', 'm'), 'case': ('l', 'n', 'a', 'p', 'v', 'm'),
+                'degree': ('a', 'd')}
+
 # This should place the models in a predictable place no matter the OS.
 model_folder = os.path.join(os.path.expanduser('~'), 'angel_models')
 
-# See if models have been downloaded. If not, download them.
-if os.path.isdir(model_folder) and 'fasttext.wordvectors' in os.listdir(model_folder):
-    wv = KeyedVectors.load(os.path.join(model_folder, 'fasttext.wordvectors'))
-else:
-    # Download the models if they don't exist
-    print('Ancient Greek language models need to be downloaded. Once downloaded, the models will be saved locally. '
-          'This should only be required once. It may take a minute. These are big files.')
-    print('Downloading models...')
+# Written by pack_model_weights(). create_morph_classes() uses it instead of the HDF5 files whenever it exists.
+weights_path = os.path.join(model_folder, 'angel.weights')
 
-    # URL needs to look like https://drive.google.com/uc?id=1-w6Ld2r1Z9kKI2oZ3RWTsmNdJSb12hxP
-    url = 'https://drive.google.com/uc?id=1MPTNoRNnTEY818BOdCjRhs7nSG3PgRWW'
-    output = 'models.tar.xz'
-    gdown.download(url, output, quiet=False)
-    extract_folder = os.path.join(os.path.expanduser('~'), 'angel_models')
+# Written by export_models(). create_morph_classes() prefers these over everything else whenever they exist.
+saved_models_path = os.path.join(model_folder, 'saved_models')
 
-    print(f'Unpacking models to {extract_folder}...')
-    tar = tarfile.open(output, 'r:xz')
-    tar.extractall(path=extract_folder)
-    tar.close()
+# Where models are installed from: a URL, local folder, or tar archive holding a manifest.json, or by default the
+# original archive on Google Drive. Set ANGEL_MODEL_SOURCE to install from a mirror instead.
+model_source = os.environ.get('ANGEL_MODEL_SOURCE', 'https://drive.google.com/uc?id=1MPTNoRNnTEY818BOdCjRhs7nSG3PgRWW')
+
+# See if models have been installed. If not, install them.
+if not models_installed(model_folder, required_model_files()):
+    print('Ancient Greek language models need to be downloaded. Once downloaded, the models will be saved locally. '
+          'This should only be required once. It may take a minute. These are big files.')
+    download_models()
 
-    # Delete the downloaded file
-    os.remove(output)
+# Whatever is timing and counting tagging calls, such as a Metrics from enable_metrics(). With nothing here, nothing is
+# timed or counted.
+observers = []
+no_observation = contextlib.nullcontext()
 
-    # Load the word vectors
-    wv = KeyedVectors.load(os.path.join(extract_folder, 'fasttext.wordvectors'))
+# Load the word vectors, noting how long it took
+load_started = time.perf_counter()
+wv = load_word_vectors(model_folder)
+word_vectors_seconds = time.perf_counter() - load_started
@@ -0,0 +1,64 @@
+import os
+import sys
+import argparse
+
+# Each command imports only what it runs, since the daemon needs Unix sockets, which Windows doesn't have
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='angel', description='An Ancient Greek morphology tagger.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help='Run an HTTP tagging server which batches concurrent requests.')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--max-wait', type=float, default=0.01,
+                              help='Seconds a request waits for others to share its batch. Default 0.01.')
+    serve_parser.add_argument('--max-tokens', type=int, default=4096,
+                              help='Tokens at which a batch runs without waiting any longer. Default 4096.')
+    serve_parser.add_argument('--log-requests', action='store_true', help='Log every request.')
+    serve_parser.add_argument('--metrics', action='store_true',
+                              help='Time and count every batch and serve the totals for Prometheus at /metrics.')
+    daemon_parser = commands.add_parser('daemon', help='Keep a warm tagger behind a Unix socket for angel-client.')
+    daemon_parser.add_argument('--socket', required=True)
+    daemon_parser.add_argument('--idle-timeout', type=float, default=600,
+                               help='Seconds without a request before the daemon exits. Default 600.')
+    args = parser.parse_args()
+    if args.command == 'daemon' and args.idle_timeout <= 0:
+        daemon_parser.error('--idle-timeout must be more than 0 seconds.')
+
+    if args.command == 'serve':
+        from angel.server import serve
+        serve(args.host, args.port, args.max_wait, args.max_tokens, quiet=not args.log_requests,
+              metrics=args.metrics)
+    elif args.command == 'daemon':
+        from angel.daemon import run_daemon
+        run_daemon(args.socket, args.idle_timeout)
+
+
+def tag_main():
+    parser = argparse.ArgumentParser(prog='angel-tag', description='Tag files or stdin, writing each token and its tag '
+                                     'to stdout as soon as its part of the input is tagged.')
+    parser.add_argument('files', nargs='*', help="Files to tag, in order. Reads stdin if none are given or for '-'.")
+    parser.add_argument('--format', choices=('tsv', 'jsonl'), default='tsv',
+                        help='tsv gives token and tag, with the file first if there are several. jsonl adds offsets.')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes tagging at once, each loading the models once. Output order is kept.')
+    parser.add_argument('--annotator', default='Vanessa Gorman')
+    parser.add_argument('--chunk-chars', type=int, default=20000,
+                        help='Characters of input tagged at a time. Default 20000.')
+    args = parser.parse_args()
+
+    from angel.files import tag_files, write_results
+    files = args.files or ['-']
+    sys.stdout.reconfigure(encoding='utf-8')
+    try:
+        write_results(tag_files(files, args.annotator, args.jobs, args.chunk_chars), sys.stdout, args.format,
+                      with_path=len(files) > 1)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Output piped into something like head which stopped reading
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+if __name__ == '__main__':
+    main()
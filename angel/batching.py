@@ -0,0 +1,138 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from angel import create_morph_classes, tag_documents, tokenize, all_annotators
+
+
+def check_request(tokens, annotator):
+    """Raise TypeError unless tokens is a list of strings, or ValueError for an unknown annotator."""
+    if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+        raise TypeError('tokens must be a list of strings.')
+    if annotator not in all_annotators:
+        raise ValueError(f'Unknown annotator {annotator}.')
+
+
+class MicroBatcher:
+    """Collect tagging requests from any number of threads and tag them together.
+
+    The first request in the queue waits up to max_wait seconds for others to join it, or until max_tokens tokens
+    have been gathered, and then the whole batch goes through each stage of the models at once. Requests are checked
+    before they are queued, and if a batch fails anyway each of its requests is tagged alone, so one bad request
+    never fails the others."""
+    def __init__(self, morphs, max_wait=0.01, max_tokens=4096):
+        self.morphs = morphs
+        self.max_wait = max_wait
+        self.max_tokens = max_tokens
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.documents = 0
+        self.tokens = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, tokens, annotator='Vanessa Gorman'):
+        """Queue a list of tokens and return a Future for its (token, tag) pairs."""
+        check_request(tokens, annotator)
+        future = Future()
+        self.requests.put((tokens, annotator, future))
+        return future
+
+    def tag(self, tokens, annotator='Vanessa Gorman'):
+        """Queue a list of tokens and wait for its (token, tag) pairs."""
+        return self.submit(tokens, annotator).result()
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            batch_tokens = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while batch_tokens < self.max_tokens:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                batch_tokens += len(request[0])
+
+            # Requests cancelled while they waited are dropped
+            batch = [request for request in batch if request[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = tag_documents([tokens for tokens, _, _ in batch], self.morphs,
+                                        [annotator for _, annotator, _ in batch])
+            except Exception as error:
+                results = [error] if len(batch) == 1 else [self.tag_alone(tokens, annotator)
+                                                            for tokens, annotator, _ in batch]
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self.batches += 1
+            self.documents += len(batch)
+            self.tokens += batch_tokens
+
+    def tag_alone(self, tokens, annotator):
+        """Tag one request by itself, returning the error instead if it fails."""
+        try:
+            return tag_documents([tokens], self.morphs, [annotator])[0]
+        except Exception as error:
+            return error
+
+
+class Tagger:
+    """Keep the models loaded and tag text from any number of threads or asyncio tasks in shared batches.
+
+    At most max_pending requests are queued or being tagged at once, counting tag() and atag() callers together.
+    Further atag() callers wait their turn without blocking the event loop, and further tag() callers block."""
+    def __init__(self, morphs=None, max_wait=0.01, max_tokens=4096, max_pending=64):
+        self.batcher = MicroBatcher(morphs if morphs is not None else create_morph_classes(), max_wait, max_tokens)
+        self.max_pending = max_pending
+        self.pending = threading.BoundedSemaphore(max_pending)
+
+        # atag() callers who find no room queue here for a thread which waits on the same semaphore as tag()
+        self.async_waiter = ThreadPoolExecutor(max_workers=1, thread_name_prefix='angel-tagger-wait')
+
+    def tag(self, text, annotator='Vanessa Gorman'):
+        """Tag a string and return a tuple of (token, tag) pairs, which compares equal to what angel.tag() returns."""
+        return self.tag_tokens(tokenize(text)[0], annotator)
+
+    def tag_tokens(self, tokens, annotator='Vanessa Gorman'):
+        """Tag a list of tokens and return a tuple of (token, tag) pairs."""
+        with self.pending:
+            return self.batcher.tag(tokens, annotator)
+
+    async def atag(self, text, annotator='Vanessa Gorman'):
+        """Tag a string without blocking the event loop and return a tuple of (token, tag) pairs."""
+        return await self.atag_tokens(tokenize(text)[0], annotator)
+
+    async def atag_tokens(self, tokens, annotator='Vanessa Gorman'):
+        """Tag a list of tokens without blocking the event loop.
+
+        If the caller is cancelled before its batch starts, its tokens are dropped from the batch."""
+        check_request(tokens, annotator)
+        await self.acquire_pending()
+        try:
+            future = self.batcher.submit(tokens, annotator)
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+        finally:
+            self.pending.release()
+
+    async def acquire_pending(self):
+        """Take a place among the max_pending requests, waiting on a thread if there is none free."""
+        if self.pending.acquire(blocking=False):
+            return
+        acquire = self.async_waiter.submit(self.pending.acquire)
+        try:
+            await asyncio.wrap_future(acquire)
+        except asyncio.CancelledError:
+            # A wait which already started will still take a place, so hand it straight back
+            if not acquire.cancel():
+                acquire.add_done_callback(lambda done: self.pending.release())
+            raise
@@ -0,0 +1,104 @@
+import os
+import json
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from angel import tokenize
+from angel.batching import Tagger, check_request
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Read one JSON request line, then stream back one JSON line per token and a final {"done": true}.
+
+    If anything goes wrong a final {"error": ...} is sent instead, with "internal": true unless the request was bad."""
+    def handle(self):
+        daemon = self.server
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            tokens = request['tokens'] if 'tokens' in request else tokenize(request['text'])[0]
+            annotator = request.get('annotator', 'Vanessa Gorman')
+            check_request(tokens, annotator)
+            for token_tag in daemon.tagger.tag_tokens(tokens, annotator):
+                self.wfile.write(json.dumps(token_tag, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.write(b'{"done": true}\n')
+        except (ValueError, KeyError, TypeError) as error:
+            self.write_error({'error': str(error)})
+        except BrokenPipeError:
+            pass
+        except Exception as error:
+            # Anything else going wrong in tagging is reported too, so a client never mistakes a cut off stream for
+            # a finished one
+            traceback.print_exc()
+            message = f'{type(error).__name__}: {error}' if str(error) else type(error).__name__
+            self.write_error({'error': message, 'internal': True})
+        finally:
+            with daemon.activity:
+                daemon.active -= 1
+                daemon.last_request = time.monotonic()
+
+    def write_error(self, reply):
+        try:
+            self.wfile.write(json.dumps(reply, ensure_ascii=False).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+
+
+class TaggingDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def process_request(self, request, client_address):
+        # Counted as soon as it's accepted so the idle check can't shut down under a connection about to be handled
+        with self.activity:
+            self.active += 1
+        super().process_request(request, client_address)
+
+
+def socket_in_use(path):
+    """Check whether a daemon is already answering on a socket."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def run_daemon(path, idle_timeout=600):
+    """Load the models, answer tagging requests on a Unix socket, and exit after idle_timeout seconds without any.
+
+    The socket only appears once the models are loaded, so a client which can connect can be answered."""
+    if idle_timeout <= 0:
+        raise ValueError(f'idle_timeout must be more than 0 seconds, not {idle_timeout}.')
+    if socket_in_use(path):
+        print(f'A daemon is already running on {path}.')
+        return
+    tagger = Tagger()
+    if os.path.exists(path):
+        os.remove(path)
+    daemon = TaggingDaemon(path, DaemonHandler)
+    daemon.tagger = tagger
+    daemon.activity = threading.Lock()
+    daemon.active = 0
+    daemon.last_request = time.monotonic()
+
+    def shut_down_when_idle():
+        while True:
+            time.sleep(min(max(idle_timeout, 0.1), 1))
+            with daemon.activity:
+                if daemon.active == 0 and time.monotonic() - daemon.last_request > idle_timeout:
+                    break
+        daemon.shutdown()
+
+    threading.Thread(target=shut_down_when_idle, daemon=True).start()
+    print(f'Tagging on {path}. Exiting after {idle_timeout}s idle.', flush=True)
+    try:
+        daemon.serve_forever()
+    finally:
+        daemon.server_close()
+        if os.path.exists(path):
+            os.remove(path)
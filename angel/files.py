@@ -0,0 +1,123 @@
+import os
+import io
+import sys
+import json
+import contextlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import tensorflow as tf
+from angel import create_morph_classes, tokenize, tag_documents
+
+# Lines ending with one of these, or blank lines, are where a chunk is preferably cut once it has reached its size
+sentence_ends = ('.', ';', '·', '\u037e', '\u0387')
+
+# Each worker process loads its own models once and keeps them here
+worker_morphs = None
+
+
+def read_chunks(path, chunk_chars=20000):
+    """Yield (text, offset) pieces of a file, or of stdin for '-', without reading all of it at once.
+
+    A chunk is cut at the first blank line or sentence end after chunk_chars characters, or at twice that regardless.
+    offset is the chunk's first character's offset in the file."""
+    infile = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='') if path == '-' \
+        else open(path, encoding='utf-8', newline='')
+    with infile:
+        lines = []
+        size = 0
+        offset = 0
+        for line in infile:
+            lines.append(line)
+            size += len(line)
+            stripped = line.rstrip()
+            if size >= chunk_chars * 2 or (size >= chunk_chars and (not stripped or stripped.endswith(sentence_ends))):
+                yield ''.join(lines), offset
+                offset += size
+                lines = []
+                size = 0
+        if lines:
+            yield ''.join(lines), offset
+
+
+def read_token_chunks(paths, chunk_chars=20000):
+    """Yield (path, tokens, offsets, before, after) for every chunk of every file, offsets counted from the file start.
+
+    before and after are the 7 tokens either side of the chunk in the same file, which tag_chunk() needs so that the
+    LSTM2 windows at the edges of a chunk see what they would if the whole file were tagged at once."""
+    for path in paths:
+        previous = None
+        for text, offset in read_chunks(path, chunk_chars):
+            tokens, offsets = tokenize(text)
+            if not tokens:
+                continue
+            offsets = [(start + offset, end + offset) for start, end in offsets]
+            if previous:
+                yield previous + (tokens[:7],)
+                before = previous[1][-7:]
+            else:
+                before = []
+            previous = (path, tokens, offsets, before)
+        if previous:
+            yield previous + ([],)
+
+
+def tag_chunk(tokens, offsets, before, after, annotator, morphs=None):
+    """Tag a chunk of tokens with its neighbours as context, returning (token, tag, start, end) tuples."""
+    tagged = tag_documents([before + tokens + after], morphs or worker_morphs, [annotator])[0]
+    return [(token, token_tag, start, end)
+            for (token, token_tag), (start, end) in zip(tagged[len(before):len(before) + len(tokens)], offsets)]
+
+
+def start_worker(threads):
+    """Load the models in a worker process, keeping its progress messages off stdout."""
+    global worker_morphs
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    with contextlib.redirect_stdout(sys.stderr):
+        worker_morphs = create_morph_classes()
+
+
+def tag_files(paths, annotator='Vanessa Gorman', jobs=1, chunk_chars=20000):
+    """Yield (path, token, tag, start, end) for every token of the given files, in file order.
+
+    With jobs above 1 the chunks are tagged by that many worker processes, each loading the models once. Results still
+    come out in order, and only a few chunks per worker are read ahead, so memory stays flat however long the files."""
+    chunks = read_token_chunks(paths, chunk_chars)
+    if jobs <= 1:
+        with contextlib.redirect_stdout(sys.stderr):
+            morphs = create_morph_classes()
+        for path, tokens, offsets, before, after in chunks:
+            for token_tag in tag_chunk(tokens, offsets, before, after, annotator, morphs):
+                yield (path,) + token_tag
+        return
+
+    # Split the cores between the workers so they don't all contend for every one of them
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('spawn'), initializer=start_worker,
+                             initargs=(threads,)) as executor:
+        pending = deque()
+        for path, tokens, offsets, before, after in chunks:
+            pending.append((path, executor.submit(tag_chunk, tokens, offsets, before, after, annotator)))
+            if len(pending) >= jobs * 2:
+                yield from chunk_results(*pending.popleft())
+        while pending:
+            yield from chunk_results(*pending.popleft())
+
+
+def chunk_results(path, future):
+    for token_tag in future.result():
+        yield (path,) + token_tag
+
+
+def write_results(results, outfile, output_format='tsv', with_path=False):
+    """Write tag_files() results as TSV lines of token and tag, or as JSON lines which also hold the offsets."""
+    for path, token, token_tag, start, end in results:
+        if output_format == 'jsonl':
+            outfile.write(json.dumps({'file': path, 'token': token, 'tag': token_tag, 'start': start, 'end': end},
+                                     ensure_ascii=False) + '\n')
+        elif with_path:
+            outfile.write(f'{path}\t{token}\t{token_tag}\n')
+        else:
+            outfile.write(f'{token}\t{token_tag}\n')
@@ -0,0 +1,129 @@
+import time
+import threading
+import contextlib
+from collections import defaultdict
+
+# What each count means, as it appears on a dashboard
+count_help = {'tokens': 'Tokens tagged.',
+              'truncated_tokens': 'Tokens longer than the 21 characters LSTM1 sees, which keep only their ends.',
+              'characters': 'Characters one-hot encoded for LSTM1.',
+              'other_characters': 'Characters encoded in the "other" slot because they are not in all_norm_characters.',
+              'vector_lookups': 'Tokens looked up in the word vectors.',
+              'oov_tokens': 'Tokens whose normalized form is not in the word vectors.'}
+
+
+class Metrics:
+    """Time every stage of every tagging call and count what went through it, for all threads together.
+
+    The outermost span on a thread is a call. Every span inside it is a stage, keyed by its name and aspect, so the
+    same stage of different aspects is timed separately. callback, if given, is called with a dict describing each
+    call as it finishes. caches maps names to lru_cache functions whose hit rates are reported too."""
+    def __init__(self, callback=None, caches=None):
+        self.callback = callback
+        self.caches = caches or {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.calls = defaultdict(int)
+        self.call_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.stage_seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextlib.contextmanager
+    def span(self, name, aspect=None, **details):
+        local = self.local
+        depth = getattr(local, 'depth', 0)
+        if depth == 0:
+            local.record = {'function': name, 'stage_seconds': defaultdict(float), 'stage_runs': defaultdict(int),
+                            'counts': defaultdict(int)}
+        local.depth = depth + 1
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start_time
+            local.depth = depth
+            record = local.record
+            if depth > 0:
+                record['stage_seconds'][(name, aspect or '')] += seconds
+                record['stage_runs'][(name, aspect or '')] += 1
+            else:
+                record['seconds'] = seconds
+                self.finish_call(record)
+
+    def count(self, **counts):
+        """Add to the counts of the call in progress on this thread."""
+        if getattr(self.local, 'depth', 0) > 0:
+            record_counts = self.local.record['counts']
+            for name, value in counts.items():
+                record_counts[name] += value
+        else:
+            with self.lock:
+                for name, value in counts.items():
+                    self.counts[name] += value
+
+    def finish_call(self, record):
+        with self.lock:
+            self.calls[record['function']] += 1
+            self.call_seconds[record['function']] += record['seconds']
+            for stage, seconds in record['stage_seconds'].items():
+                self.stage_calls[stage] += record['stage_runs'][stage]
+                self.stage_seconds[stage] += seconds
+            for name, value in record['counts'].items():
+                self.counts[name] += value
+        if self.callback is not None:
+            self.callback(record)
+
+    def cache_hit_rates(self):
+        """Return the fraction of lookups each cache answered, or None for a cache which hasn't been used."""
+        rates = {}
+        for name, cached_function in self.caches.items():
+            info = cached_function.cache_info()
+            rates[name] = info.hits / (info.hits + info.misses) if info.hits + info.misses else None
+        return rates
+
+    def summary(self):
+        """Return the totals so far along with the rates worked out from them."""
+        with self.lock:
+            counts = dict(self.counts)
+            summary = {'calls': dict(self.calls), 'call_seconds': dict(self.call_seconds), 'counts': counts,
+                       'stage_seconds': {f'{name}:{aspect}' if aspect else name: seconds
+                                         for (name, aspect), seconds in self.stage_seconds.items()}}
+        summary['oov_rate'] = counts['oov_tokens'] / counts['vector_lookups'] if counts.get('vector_lookups') else None
+        summary['truncated_rate'] = counts['truncated_tokens'] / counts['tokens'] if counts.get('tokens') else None
+        summary['other_character_rate'] = (counts['other_characters'] / counts['characters']
+                                           if counts.get('characters') else None)
+        summary['cache_hit_rates'] = self.cache_hit_rates()
+        return summary
+
+    def to_prometheus(self, prefix='angel'):
+        """Return every total in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {metric_type}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{prefix}_{name}{{{label_text}}} {value}' if labels else f'{prefix}_{name} {value}')
+
+        with self.lock:
+            metric('calls_total', 'counter', 'Tagging calls.',
+                   [({'function': function}, calls) for function, calls in self.calls.items()])
+            metric('call_seconds_total', 'counter', 'Seconds spent in tagging calls.',
+                   [({'function': function}, seconds) for function, seconds in self.call_seconds.items()])
+            metric('stage_calls_total', 'counter', 'Times each stage ran.',
+                   [({'stage': stage, 'aspect': aspect}, calls) for (stage, aspect), calls in self.stage_calls.items()])
+            metric('stage_seconds_total', 'counter', 'Seconds spent in each stage.',
+                   [({'stage': stage, 'aspect': aspect}, seconds)
+                    for (stage, aspect), seconds in self.stage_seconds.items()])
+            for name, help_text in count_help.items():
+                metric(f'{name}_total', 'counter', help_text, [({}, self.counts[name])])
+        cache_infos = {name: cached_function.cache_info() for name, cached_function in self.caches.items()}
+        metric('cache_hits_total', 'counter', 'Lookups answered from each cache.',
+               [({'cache': name}, info.hits) for name, info in cache_infos.items()])
+        metric('cache_misses_total', 'counter', 'Lookups each cache had to work out.',
+               [({'cache': name}, info.misses) for name, info in cache_infos.items()])
+        metric('cache_entries', 'gauge', 'Entries held by each cache.',
+               [({'cache': name}, info.currsize) for name, info in cache_infos.items()])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import tensorflow as tf
+
+
+class Profiler:
+    """Record every span of every tagging call as a Chrome trace event, with its aspect, shapes, and counts.
+
+    With tensorflow=True each span is also a TensorFlow trace annotation, so a TensorFlow profile taken at the same
+    time shows the tagger's phases above the ops they ran."""
+    def __init__(self, tensorflow=False):
+        self.tensorflow = tensorflow
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = time.perf_counter()
+        self.threads = {}
+
+    @contextlib.contextmanager
+    def span(self, name, aspect=None, **details):
+        args = {key: list(value) if isinstance(value, tuple) else value for key, value in details.items()}
+        if aspect:
+            args['aspect'] = aspect
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        stack = self.local.stack
+        stack.append(args)
+        if self.tensorflow:
+            annotation = tf.profiler.experimental.Trace(name, **{key: str(value) for key, value in args.items()})
+        else:
+            annotation = contextlib.nullcontext()
+        start_time = time.perf_counter()
+        try:
+            with annotation:
+                yield
+        finally:
+            end_time = time.perf_counter()
+            stack.pop()
+            thread = threading.current_thread()
+            event = {'name': f'{name} {aspect}' if aspect else name, 'cat': 'angel', 'ph': 'X',
+                     'ts': (start_time - self.start_time) * 1e6, 'dur': (end_time - start_time) * 1e6,
+                     'pid': os.getpid(), 'tid': thread.ident, 'args': args}
+            with self.lock:
+                self.events.append(event)
+                self.threads.setdefault(thread.ident, thread.name)
+
+    def count(self, **counts):
+        """Add counts to the args of the innermost span in progress on this thread."""
+        stack = getattr(self.local, 'stack', None)
+        if stack:
+            for name, value in counts.items():
+                stack[-1][name] = stack[-1].get(name, 0) + value
+
+    def trace(self):
+        """Return the recorded spans in the Chrome trace event format, which Perfetto also reads."""
+        with self.lock:
+            metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': ident, 'args': {'name': name}}
+                        for ident, name in self.threads.items()]
+            metadata.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'angel'}})
+            return {'traceEvents': metadata + sorted(self.events, key=lambda event: event['ts']),
+                    'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as json_file:
+            json.dump(self.trace(), json_file, ensure_ascii=False)
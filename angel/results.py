@@ -0,0 +1,205 @@
+import numpy as np
+
+# Rows per record batch when exporting to Arrow
+default_chunk_size = 65536
+
+# Items shown when printing a result, beyond which the middle is left out
+repr_limit = 200
+
+
+class TaggedTokens:
+    """The result of tagging, held in a few arrays rather than a tuple of string pairs.
+
+    Tokens are (start, end) offsets into text, and each aspect's tag is a small integer indexing into that aspect's tags
+    followed by '-'. It still reads like the tuple of (token, tag) pairs tag() used to return: it has a length, can be
+    indexed and sliced, iterates lazily, prints like it, and compares equal to the same tuple, though unlike the tuple
+    it can't be hashed. With with_offsets=True each item is (token, tag, start, end) instead. mask() and where() select
+    tokens by tag without building any strings, e.g. result.where(pos='v', mood='s') for every subjunctive verb.
+    to_arrow(), to_record_batches(), and to_pandas() build columns straight from the arrays."""
+    __slots__ = ('text', 'offsets', 'tag_indices', 'confidences', 'titles', 'tag_sets', 'with_offsets')
+
+    def __init__(self, text, offsets, tag_indices, confidences, aspect_tags, with_offsets=False):
+        self.text = text
+        self.offsets = offsets
+        self.tag_indices = tag_indices
+        self.confidences = confidences
+        self.titles = tuple(aspect_tags)
+        self.tag_sets = tuple(tuple(tags) + ('-',) for tags in aspect_tags.values())
+        self.with_offsets = with_offsets
+
+    @classmethod
+    def from_tokens(cls, tokens, tag_indices, confidences, aspect_tags):
+        """Make a result for already split tokens, which are joined by spaces into one string to keep as the text."""
+        lengths = np.fromiter((len(token) for token in tokens), dtype=np.int64, count=len(tokens))
+        starts = np.cumsum(lengths + 1) - (lengths + 1)
+        return cls(' '.join(tokens), np.stack((starts, starts + lengths), axis=1), tag_indices, confidences,
+                   aspect_tags)
+
+    def subset(self, selection):
+        """Return the tokens picked out by a slice, index array, or boolean mask, sharing the same text."""
+        result = TaggedTokens.__new__(TaggedTokens)
+        result.text = self.text
+        result.offsets = self.offsets[selection]
+        result.tag_indices = self.tag_indices[selection]
+        result.confidences = None if self.confidences is None else self.confidences[selection]
+        result.titles = self.titles
+        result.tag_sets = self.tag_sets
+        result.with_offsets = self.with_offsets
+        return result
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.subset(i)
+        start, end = self.offsets[i]
+        tag_string = ''.join(tags[index] for tags, index in zip(self.tag_sets, self.tag_indices[i]))
+        if self.with_offsets:
+            return self.text[start:end], tag_string, int(start), int(end)
+        return self.text[start:end], tag_string
+
+    def __iter__(self):
+        # Tags are built a block at a time, so iterating never holds more than a block of strings
+        for block_start in range(0, len(self), 4096):
+            block = slice(block_start, block_start + 4096)
+            for (start, end), tag_string in zip(self.offsets[block].tolist(), self.tag_strings(block).tolist()):
+                if self.with_offsets:
+                    yield self.text[start:end], tag_string, start, end
+                else:
+                    yield self.text[start:end], tag_string
+
+    def __eq__(self, other):
+        if isinstance(other, (TaggedTokens, tuple, list)):
+            return len(self) == len(other) and all(mine == theirs for mine, theirs in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        if len(self) <= repr_limit:
+            return repr(tuple(self))
+        head = ', '.join(map(repr, self[:repr_limit // 2]))
+        tail = ', '.join(map(repr, self[-(repr_limit // 2):]))
+        return f'({head}, ..., {tail})'
+
+    @property
+    def tokens(self):
+        """Return every token as a list of strings."""
+        return [self.text[start:end] for start, end in self.offsets.tolist()]
+
+    def tag_strings(self, selection=slice(None)):
+        """Return the nine-character tags of the selected tokens, all of them by default, as a NumPy string array."""
+        columns = np.stack([np.array(tags)[self.tag_indices[selection, k]] for k, tags in enumerate(self.tag_sets)],
+                           axis=1)
+        return np.ascontiguousarray(columns).view(f'<U{len(self.tag_sets)}').ravel()
+
+    def aspect(self, title):
+        """Return one aspect's tag for every token as a NumPy array of one-character strings."""
+        k = self.titles.index(title)
+        return np.array(self.tag_sets[k])[self.tag_indices[:, k]]
+
+    def mask(self, **conditions):
+        """Return a boolean array marking the tokens whose tags meet every condition.
+
+        Each condition is an aspect title set to a tag or to several tags any of which will do, e.g. pos='v' or
+        case=('g', 'd')."""
+        selected = np.ones(len(self), dtype=bool)
+        for title, wanted in conditions.items():
+            if title not in self.titles:
+                raise ValueError(f'Unknown aspect {title}. Choose from {list(self.titles)}.')
+            k = self.titles.index(title)
+            wanted = (wanted,) if isinstance(wanted, str) else tuple(wanted)
+            unknown = [tag for tag in wanted if tag not in self.tag_sets[k]]
+            if unknown:
+                raise ValueError(f'Unknown {title} tags {unknown}. Choose from {list(self.tag_sets[k])}.')
+            allowed = np.zeros(len(self.tag_sets[k]), dtype=bool)
+            allowed[[self.tag_sets[k].index(tag) for tag in wanted]] = True
+            selected &= allowed[self.tag_indices[:, k]]
+        return selected
+
+    def where(self, **conditions):
+        """Return only the tokens whose tags meet every condition, as mask() takes them."""
+        return self.subset(self.mask(**conditions))
+
+    def utf8_offsets(self):
+        """Return the offsets in bytes of the UTF-8 encoding of the text, along with that encoding."""
+        code_points = np.frombuffer(self.text.encode('utf-32-le'), dtype=np.uint32)
+        byte_lengths = 1 + (code_points >= 0x80) + (code_points >= 0x800) + (code_points >= 0x10000)
+        byte_offsets = np.concatenate(([0], np.cumsum(byte_lengths)))
+        return byte_offsets[self.offsets], self.text.encode('utf-8')
+
+    def to_record_batches(self, confidences=False, chunk_size=default_chunk_size, document=None):
+        """Yield the tokens as Arrow record batches of up to chunk_size rows, ready to stream into Parquet or Feather.
+
+        The columns are token, start, end, one dictionary-encoded column per aspect, and with confidences=True one
+        float32 column per aspect named like pos_confidence. The token strings are gathered out of the text's UTF-8
+        bytes, so no Python object is made per token. If document is given it fills a document column, which tells
+        the documents of a corpus apart when their batches go into the same file."""
+        import pyarrow as pa
+        byte_offsets, encoded = self.utf8_offsets()
+        encoded = np.frombuffer(encoded, dtype=np.uint8)
+        dictionaries = [pa.array(tags) for tags in self.tag_sets]
+        for chunk_start in range(0, len(self), chunk_size):
+            chunk = slice(chunk_start, chunk_start + chunk_size)
+
+            # Copy each token's bytes next to each other, with the offsets Arrow needs to find them
+            starts, ends = byte_offsets[chunk, 0], byte_offsets[chunk, 1]
+            token_offsets = np.concatenate(([0], np.cumsum(ends - starts))).astype(np.int32)
+            token_bytes = encoded[np.repeat(starts - token_offsets[:-1], ends - starts) + np.arange(token_offsets[-1])]
+            columns = {'token': pa.StringArray.from_buffers(len(starts), pa.py_buffer(token_offsets),
+                                                            pa.py_buffer(token_bytes)),
+                       'start': pa.array(self.offsets[chunk, 0]),
+                       'end': pa.array(self.offsets[chunk, 1])}
+            for k, title in enumerate(self.titles):
+                columns[title] = pa.DictionaryArray.from_arrays(
+                    pa.array(self.tag_indices[chunk, k].astype(np.int8)), dictionaries[k])
+            if confidences:
+                for k, title in enumerate(self.titles):
+                    columns[f'{title}_confidence'] = pa.array(np.ascontiguousarray(self.confidences[chunk, k]))
+            if document is not None:
+                columns = {'document': pa.repeat(document, len(starts)), **columns}
+            yield pa.RecordBatch.from_pydict(columns)
+
+    def to_arrow(self, confidences=False, chunk_size=default_chunk_size, document=None):
+        """Return the tokens as an Arrow table made of to_record_batches() batches."""
+        import pyarrow as pa
+        batches = list(self.to_record_batches(confidences, chunk_size, document))
+        if not batches:
+            return self.arrow_schema(confidences, document).empty_table()
+        return pa.Table.from_batches(batches)
+
+    def to_pandas(self, confidences=False):
+        """Return the tokens as a pandas DataFrame, with each aspect's tags as a categorical column."""
+        return self.to_arrow(confidences).to_pandas()
+
+    def arrow_schema(self, confidences=False, document=None):
+        """Return the schema of to_record_batches(), e.g. to open a ParquetWriter before any text is tagged."""
+        import pyarrow as pa
+        fields = [('token', pa.string()), ('start', pa.int64()), ('end', pa.int64())]
+        fields += [(title, pa.dictionary(pa.int8(), pa.string())) for title in self.titles]
+        if confidences:
+            fields += [(f'{title}_confidence', pa.float32()) for title in self.titles]
+        if document is not None:
+            fields = [('document', pa.array([document]).type)] + fields
+        return pa.schema(fields)
+
+
+def write_tagged(results, path, file_format='parquet', confidences=False, chunk_size=default_chunk_size):
+    """Write an iterable of TaggedTokens to one Parquet or Feather file as they come, holding one batch at a time.
+
+    Each row's document column holds the position of its result in the iterable. Returns the number of rows written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    rows = 0
+    try:
+        for document, result in enumerate(results):
+            if writer is None:
+                schema = result.arrow_schema(confidences, document)
+                writer = pq.ParquetWriter(path, schema) if file_format == 'parquet' else pa.ipc.new_file(path, schema)
+            for batch in result.to_record_batches(confidences, chunk_size, document):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
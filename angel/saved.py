@@ -0,0 +1,170 @@
+import os
+import json
+import threading
+import weakref
+import numpy as np
+import tensorflow as tf
+
+# Batch sizes every exported model gets a fixed signature for. Anything bigger runs in chunks of the largest.
+default_buckets = (16, 128, 1024)
+
+
+class SavedStage:
+    """Run an exported SavedModel through the signature of the smallest batch bucket that fits.
+
+    It has predict() and predict_on_batch() so it can stand in for a Keras model. A fused stage returns one output per
+    aspect, so outputs() gives all of them while predict() gives the first."""
+    def __init__(self, path, warm_up=True):
+        loaded = tf.saved_model.load(path)
+        self.loaded = loaded
+        self.signatures = {int(name.split('_')[1]): loaded.signatures[name] for name in loaded.signatures
+                           if name.startswith('batch_')}
+        self.buckets = sorted(self.signatures)
+        first_signature = self.signatures[self.buckets[0]]
+        self.input_shape = tuple(first_signature.structured_input_signature[1]['inputs'].shape[1:])
+        self.output_count = len(first_signature.structured_outputs)
+
+        # Used by FusedOutput to hand every aspect its share of one run
+        self.lock = threading.RLock()
+        self.readers = set()
+        self.clear_cache()
+
+        # Running each signature once up front means the first real batch doesn't pay for kernel selection
+        if warm_up:
+            for bucket in self.buckets:
+                self.signatures[bucket](inputs=tf.zeros((bucket,) + self.input_shape))
+
+    def outputs(self, inputs):
+        """Return every output of the stage for a batch of any size."""
+        inputs = np.asarray(inputs, dtype=np.float32)
+        largest = self.buckets[-1]
+        chunks = []
+        for start in range(0, max(len(inputs), 1), largest):
+            chunk = inputs[start:start + largest]
+            bucket = min(bucket for bucket in self.buckets if bucket >= len(chunk))
+            padding = np.zeros((bucket - len(chunk),) + self.input_shape, dtype=np.float32)
+            outputs = self.signatures[bucket](inputs=tf.constant(np.concatenate((chunk, padding))))
+            chunks.append([outputs[f'output_{i}'].numpy()[:len(chunk)] for i in range(self.output_count)])
+        return [np.concatenate(output_chunks) for output_chunks in zip(*chunks)]
+
+    def predict(self, inputs, **kwargs):
+        return self.outputs(inputs)[0]
+
+    def predict_on_batch(self, inputs):
+        return self.outputs(inputs)[0]
+
+    def clear_cache(self, inputs_reference=None):
+        """Drop the outputs kept for FusedOutput, or only if they still belong to inputs_reference when it's given."""
+        with self.lock:
+            if inputs_reference is None or inputs_reference is self.cached_inputs:
+                self.cached_inputs = None
+                self.cached_outputs = None
+                self.cached_rows = None
+                self.unread = set()
+
+
+class FusedOutput:
+    """One aspect's share of a stage exported with every aspect fused into a single graph.
+
+    Every aspect is handed the same input array in turn, so the fused graph runs on the first and the rest are served
+    from what it returned. A different array, even one with the same contents, runs the graph again. When aspects only
+    need some rows of the array, as with the cascade, predict_rows() runs the graph just once on each row any of them
+    asks for. The outputs are dropped once every aspect has read its share or the input array is freed, and the input
+    array itself is never kept alive."""
+    def __init__(self, stage, index):
+        self.stage = stage
+        self.index = index
+        stage.readers.add(index)
+
+    def predict(self, inputs, **kwargs):
+        return self.predict_rows(inputs, np.arange(len(inputs)))
+
+    def predict_on_batch(self, inputs):
+        return self.predict(inputs)
+
+    def predict_rows(self, inputs, rows):
+        """Return this aspect's output for the given rows of inputs."""
+        stage = self.stage
+        with stage.lock:
+            if stage.cached_inputs is None or stage.cached_inputs() is not inputs:
+                stage.clear_cache()
+                stage.cached_inputs = weakref.ref(inputs, stage.clear_cache)
+                stage.cached_rows = np.zeros(len(inputs), dtype=bool)
+                stage.unread = set(stage.readers)
+
+            # Only rows no aspect has asked for yet go through the graph
+            missing = rows[~stage.cached_rows[rows]]
+            if len(missing) > 0 or stage.cached_outputs is None:
+                new_outputs = stage.outputs(inputs if len(missing) == len(inputs) else inputs[missing])
+                if stage.cached_outputs is None:
+                    stage.cached_outputs = [np.zeros((len(inputs),) + output.shape[1:], dtype=output.dtype)
+                                            for output in new_outputs]
+                for cached_output, new_output in zip(stage.cached_outputs, new_outputs):
+                    cached_output[missing] = new_output
+                stage.cached_rows[missing] = True
+            output = stage.cached_outputs[self.index][rows]
+
+            stage.unread.discard(self.index)
+            if not stage.unread:
+                stage.clear_cache()
+            return output
+
+
+class SavedModels:
+    """Load models exported by export_saved_models() by the same names WeightsFile uses, e.g. pos-lstm1."""
+    def __init__(self, folder, warm_up=True):
+        self.folder = folder
+        self.warm_up = warm_up
+        with open(os.path.join(folder, 'config.json'), encoding='utf-8') as json_file:
+            self.config = json.load(json_file)
+        self.fused_stages = {}
+        self.lock = threading.Lock()
+
+    def load(self, name):
+        """Return a model which runs like a Keras model."""
+        if not self.config['fused']:
+            return SavedStage(os.path.join(self.folder, name), self.warm_up)
+
+        # All aspects share one loaded graph per stage
+        title, stage = name.split('-')
+        with self.lock:
+            if stage not in self.fused_stages:
+                self.fused_stages[stage] = SavedStage(os.path.join(self.folder, f'fused-{stage}'), self.warm_up)
+        return FusedOutput(self.fused_stages[stage], self.config['titles'].index(title))
+
+
+def save_stage(models, path, buckets):
+    """Save one or more Keras models which take the same input as a SavedModel with one signature per bucket."""
+    module = tf.Module()
+    module.models = models
+
+    @tf.function
+    def serve(inputs):
+        return tuple(model(inputs, training=False) for model in models)
+
+    module.serve = serve
+    input_shape = tuple(models[0].input_shape[1:])
+    signatures = {f'batch_{bucket}': serve.get_concrete_function(tf.TensorSpec((bucket,) + input_shape, tf.float32,
+                                                                               name='inputs')) for bucket in buckets}
+    tf.saved_model.save(module, path, signatures=signatures)
+
+
+def export_saved_models(models, folder, buckets=default_buckets, fused=False):
+    """Export a dict of names like pos-lstm1 to Keras models as SavedModels with fixed batch signatures.
+
+    With fused=True each stage is exported once with every aspect in it, since all aspects share the same input."""
+    os.makedirs(folder, exist_ok=True)
+    titles = list(dict.fromkeys(name.split('-')[0] for name in models))
+    stages = list(dict.fromkeys(name.split('-')[1] for name in models))
+    if fused:
+        for stage in stages:
+            print(f'Exporting fused {stage.upper()}...')
+            save_stage([models[f'{title}-{stage}'] for title in titles], os.path.join(folder, f'fused-{stage}'),
+                       buckets)
+    else:
+        for name, model in models.items():
+            print(f'Exporting {name}...')
+            save_stage([model], os.path.join(folder, name), buckets)
+
+    with open(os.path.join(folder, 'config.json'), 'w', encoding='utf-8') as json_file:
+        json.dump({'fused': fused, 'buckets': list(buckets), 'titles': titles}, json_file)
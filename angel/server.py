@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from angel import create_morph_classes, tokenize, enable_metrics
+from angel.batching import MicroBatcher, check_request
+
+
+class TaggingServer(ThreadingHTTPServer):
+    """An HTTP server which keeps a long enough backlog for bursts of concurrent clients."""
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class TaggingHandler(BaseHTTPRequestHandler):
+    """Answer POST /tag, GET /health, GET /ready, and GET /metrics if the server was started with metrics."""
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, status, text, content_type='text/plain; charset=utf-8'):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        batcher = self.server.batcher
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        elif self.path == '/ready':
+            if batcher is None:
+                self.send_json(503, {'ready': False})
+            else:
+                self.send_json(200, {'ready': True, 'batches': batcher.batches, 'documents': batcher.documents,
+                                     'tokens': batcher.tokens})
+        elif self.path == '/metrics' and self.server.metrics is not None:
+            self.send_text(200, self.server.metrics.to_prometheus(), 'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            self.send_json(404, {'error': f'No such path {self.path}.'})
+
+    def do_POST(self):
+        """Tag {"text": "..."} or {"tokens": [...]}, optionally with "annotator", and return {"tokens": [[t, tag]]}."""
+        if self.path != '/tag':
+            self.send_json(404, {'error': f'No such path {self.path}.'})
+            return
+        if self.server.batcher is None:
+            self.send_json(503, {'error': 'Models are still loading.'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            tokens = request['tokens'] if 'tokens' in request else tokenize(request['text'])[0]
+            annotator = request.get('annotator', 'Vanessa Gorman')
+            check_request(tokens, annotator)
+        except (ValueError, KeyError, TypeError) as error:
+            self.send_json(400, {'error': f'Bad request: {error}'})
+            return
+        try:
+            self.send_json(200, {'tokens': self.server.batcher.tag(tokens, annotator)})
+        except Exception as error:
+            self.send_json(500, {'error': f'Tagging failed: {error}'})
+
+    def log_message(self, *args):
+        if not self.server.quiet:
+            super().log_message(*args)
+
+
+def serve(host='127.0.0.1', port=8000, max_wait=0.01, max_tokens=4096, quiet=True, metrics=False):
+    """Run the tagging server until interrupted. It answers /health at once and /ready once the models are loaded.
+
+    With metrics=True every batch is timed and counted, and /metrics gives the totals in Prometheus text format."""
+    server = TaggingServer((host, port), TaggingHandler)
+    server.batcher = None
+    server.quiet = quiet
+    server.metrics = enable_metrics() if metrics else None
+
+    def load():
+        server.batcher = MicroBatcher(create_morph_classes(), max_wait, max_tokens)
+        print(f'Ready on http://{host}:{server.server_port}', flush=True)
+
+    threading.Thread(target=load, daemon=True).start()
+    print(f'Listening on http://{host}:{server.server_port}, loading models...', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,226 @@
+import os
+import json
+import shutil
+import hashlib
+import tarfile
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# A mirror is a URL, a local folder, or a tar archive. Either way it holds manifest.json next to the files it lists.
+manifest_name = 'manifest.json'
+partial_folder = '.partial'
+chunk_size = 2**20
+
+
+def component_of(path):
+    """Name the component a model file belongs to, e.g. pos-lstm1, vectors, or compact_vectors."""
+    if path.startswith('fasttext.wordvectors'):
+        return 'vectors'
+    if '/' in path:
+        return path.split('/')[0]
+    if path.endswith('.h5'):
+        return '-'.join(path.split('-')[:2])
+    return path
+
+
+def file_digest(path):
+    """Return the sha256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_manifest(folder):
+    """Write manifest.json for every file in a folder so the folder can serve as a mirror, and return it."""
+    files = {}
+    for root, folders, file_names in os.walk(folder):
+        folders[:] = [name for name in folders if name != partial_folder]
+        for file_name in file_names:
+            path = os.path.relpath(os.path.join(root, file_name), folder).replace(os.sep, '/')
+            if path != manifest_name:
+                files[path] = {'sha256': file_digest(os.path.join(root, file_name)),
+                               'size': os.path.getsize(os.path.join(root, file_name)), 'component': component_of(path)}
+    manifest = {'version': 1, 'files': dict(sorted(files.items()))}
+    write_json(manifest, os.path.join(folder, manifest_name))
+    return manifest
+
+
+def write_json(data, path):
+    """Write a JSON file so that it either appears whole or not at all."""
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file, indent=1)
+    os.replace(f'{path}.tmp', path)
+
+
+def read_manifest(folder):
+    """Return the manifest of an installed model folder, or None if it has none."""
+    try:
+        with open(os.path.join(folder, manifest_name), encoding='utf-8') as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return None
+
+
+def models_installed(folder, required_files=()):
+    """Check that a model folder holds every file it needs.
+
+    Every required file must be present. With a manifest, every file in it must also be present at the right size.
+    Required files missing from the manifest, such as compact vectors made locally, only need to exist."""
+    if not required_files or not all(os.path.isfile(os.path.join(folder, path)) for path in required_files):
+        return False
+    manifest = read_manifest(folder)
+    return manifest is None or \
+        all(os.path.isfile(os.path.join(folder, path)) and os.path.getsize(os.path.join(folder, path)) == entry['size']
+            for path, entry in manifest['files'].items())
+
+
+def verify_models(folder):
+    """Return every file in an installed folder's manifest which is missing or fails its checksum."""
+    manifest = read_manifest(folder)
+    if manifest is None:
+        raise FileNotFoundError(f'{folder} has no {manifest_name} to verify against.')
+    return [path for path, entry in manifest['files'].items() if not os.path.isfile(os.path.join(folder, path)) or
+            file_digest(os.path.join(folder, path)) != entry['sha256']]
+
+
+def is_url(source):
+    """Tell a URL mirror from a local one."""
+    return source.startswith(('http://', 'https://'))
+
+
+def fetch_url(url, part_path):
+    """Download a URL into a .part file, carrying on from wherever an earlier attempt stopped."""
+    done = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    request = urllib.request.Request(url, headers={'Range': f'bytes={done}-'} if done else {})
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as error:
+        # 416 means the .part file already holds everything
+        if error.code == 416:
+            return
+        raise
+    with response:
+        # A server which ignores ranges sends the whole file again
+        mode = 'ab' if response.status == 206 else 'wb'
+        with open(part_path, mode) as outfile:
+            shutil.copyfileobj(response, outfile, chunk_size)
+
+
+def fetch_source_manifest(source):
+    """Read the manifest of a mirror, or return None for a tar archive without one."""
+    if is_url(source):
+        with urllib.request.urlopen(f'{source.rstrip("/")}/{manifest_name}') as response:
+            return json.loads(response.read().decode('utf-8'))
+    if os.path.isdir(source):
+        with open(os.path.join(source, manifest_name), encoding='utf-8') as json_file:
+            return json.load(json_file)
+    with tarfile.open(source) as tar:
+        for member in tar:
+            if os.path.normpath(member.name) == manifest_name:
+                return json.load(tar.extractfile(member))
+        return None
+
+
+def fetch_file(source, path, entry, folder):
+    """Fetch one file from a URL or folder mirror into folder/.partial and install it."""
+    part_path = os.path.join(folder, partial_folder, f'{path}.part')
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    if is_url(source):
+        fetch_url(f'{source.rstrip("/")}/{path}', part_path)
+    else:
+        shutil.copyfile(os.path.join(source, path), part_path)
+    install_part(part_path, path, entry, folder)
+
+
+def fetch_archive(archive, needed, folder):
+    """Unpack the needed files from a tar archive mirror in a single pass, since compressed archives can't seek."""
+    with tarfile.open(archive) as tar:
+        for member in tar:
+            path = os.path.normpath(member.name).replace(os.sep, '/')
+            if member.isfile() and path in needed:
+                part_path = os.path.join(folder, partial_folder, f'{path}.part')
+                os.makedirs(os.path.dirname(part_path), exist_ok=True)
+                with open(part_path, 'wb') as outfile:
+                    shutil.copyfileobj(tar.extractfile(member), outfile, chunk_size)
+                install_part(part_path, path, needed[path], folder)
+
+
+def install_part(part_path, path, entry, folder):
+    """Check a fetched file against its manifest entry and only then move it into place."""
+    if os.path.getsize(part_path) != entry['size'] or file_digest(part_path) != entry['sha256']:
+        os.remove(part_path)
+        raise ValueError(f'{path} does not match its checksum.')
+    os.makedirs(os.path.dirname(os.path.join(folder, path)), exist_ok=True)
+    os.replace(part_path, os.path.join(folder, path))
+
+
+def install_models(folder, source, components=None, workers=4, verify=False):
+    """Install models from a mirror into a folder, only fetching files which are missing or out of date.
+
+    Each file is downloaded into folder/.partial, checked against its sha256, and only then moved into place, so an
+    interrupted install never leaves a broken file behind and picks up where it stopped. The manifest is written last.
+    components limits the install to some components, e.g. ['vectors', 'pos-lstm1']. Files already installed are
+    trusted if their size matches, unless verify is True, in which case they are checked against their sha256."""
+    if source.startswith('file://'):
+        source = urllib.request.url2pathname(source[len('file://'):])
+    manifest = fetch_source_manifest(source)
+    if manifest is None:
+        raise ValueError(f'{source} has no {manifest_name}. Use install_archive() for an archive without one.')
+    installed = read_manifest(folder) or {'version': 1, 'files': {}}
+    wanted = {path: entry for path, entry in manifest['files'].items()
+              if components is None or entry['component'] in components}
+
+    # Files an earlier install already put in place are kept if they check out, even if it never finished
+    def up_to_date(path, entry):
+        local_path = os.path.join(folder, path)
+        if not os.path.isfile(local_path) or os.path.getsize(local_path) != entry['size']:
+            return False
+        if installed['files'].get(path) == entry and not verify:
+            return True
+        return file_digest(local_path) == entry['sha256']
+    needed = {path: entry for path, entry in wanted.items() if not up_to_date(path, entry)}
+
+    os.makedirs(folder, exist_ok=True)
+    print(f'Fetching {len(needed)} of {len(wanted)} model files from {source}...')
+    if is_url(source) or os.path.isdir(source):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fetches = {path: pool.submit(fetch_file, source, path, entry, folder) for path, entry in needed.items()}
+        failed = {path: fetch.exception() for path, fetch in fetches.items() if fetch.exception() is not None}
+        if failed:
+            raise RuntimeError(f'Could not install from {source}: ' +
+                               '; '.join(f'{path}: {error}' for path, error in failed.items()))
+    else:
+        fetch_archive(source, needed, folder)
+    missing = [path for path in needed if not os.path.isfile(os.path.join(folder, path))]
+    if missing:
+        raise RuntimeError(f'{source} is missing {", ".join(missing)}.')
+
+    installed['files'].update(wanted)
+    write_json(installed, os.path.join(folder, manifest_name))
+    shutil.rmtree(os.path.join(folder, partial_folder), ignore_errors=True)
+
+
+def install_archive(folder, archive, required_files):
+    """Install models from a tar archive which has no manifest, such as the original models.tar.xz.
+
+    Everything is unpacked next to the model folder and only swapped into place once every required file is there.
+    A manifest is then written from what was unpacked."""
+    staging_folder = f'{folder}.partial'
+    shutil.rmtree(staging_folder, ignore_errors=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(path=staging_folder)
+    missing = [path for path in required_files if not os.path.isfile(os.path.join(staging_folder, path))]
+    if missing:
+        raise RuntimeError(f'{archive} is missing {", ".join(missing)}.')
+
+    # The manifest goes in last so a folder is never marked installed before all of its files are there
+    write_manifest(staging_folder)
+    os.makedirs(folder, exist_ok=True)
+    for path in sorted(os.listdir(staging_folder), key=lambda name: name == manifest_name):
+        if os.path.isdir(os.path.join(folder, path)):
+            shutil.rmtree(os.path.join(folder, path))
+        os.replace(os.path.join(staging_folder, path), os.path.join(folder, path))
+    shutil.rmtree(staging_folder)
@@ -0,0 +1,123 @@
+import os
+import json
+import numpy as np
+
+
+class QuantizedMatrix:
+    """Hold a matrix as float16, or as int8 with one scale per row, and hand back float32 rows when indexed."""
+    def __init__(self, values, scales=None):
+        self.values = values
+        self.scales = scales
+        self.shape = values.shape
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, rows):
+        if self.scales is None:
+            return self.values[rows].astype(np.float32)
+        return self.values[rows].astype(np.float32) * self.scales[rows, None]
+
+
+class CompactVectors:
+    """A small stand-in for gensim's FastTextKeyedVectors which only holds what the tagger needs."""
+    def __init__(self, words, vectors, ngram_buckets=None, ngram_vectors=None, min_n=3, max_n=6, bucket=0):
+        self.key_to_index = {word: i for i, word in enumerate(words)}
+        self.vectors = vectors
+        self.ngram_buckets = ngram_buckets
+        self.ngram_vectors = ngram_vectors
+        self.min_n = min_n
+        self.max_n = max_n
+        self.bucket = bucket
+
+    def __getitem__(self, word):
+        """Return a word's vector, building it out of its character n-grams if it isn't in the vocabulary."""
+        index = self.key_to_index.get(word)
+        if index is not None:
+            return self.vectors[index]
+        if self.ngram_vectors is None:
+            raise KeyError(f'{word} is not in the vocabulary and there are no n-grams to build it from.')
+
+        # Same as FastText, except that any bucket left out of a reduced table counts as zero
+        from gensim.models.fasttext import ft_ngram_hashes
+        ngram_hashes = np.array(ft_ngram_hashes(word, self.min_n, self.max_n, self.bucket), dtype=np.int64)
+        word_vector = np.zeros(self.vectors.shape[1], dtype=np.float32)
+        if len(ngram_hashes) == 0:
+            return word_vector
+        if len(self.ngram_buckets) > 0:
+            rows = np.minimum(np.searchsorted(self.ngram_buckets, ngram_hashes), len(self.ngram_buckets) - 1)
+            rows = rows[self.ngram_buckets[rows] == ngram_hashes]
+            if len(rows) > 0:
+                word_vector += np.sum(self.ngram_vectors[rows], axis=0)
+        return word_vector / len(ngram_hashes)
+
+    @classmethod
+    def load(cls, folder, mmap_mode=None):
+        """Load a store written by compact_word_vectors(), memory-mapping its arrays if mmap_mode is given."""
+        with open(os.path.join(folder, 'config.json'), encoding='utf-8') as json_file:
+            config = json.load(json_file)
+        with open(os.path.join(folder, 'vocabulary.txt'), encoding='utf-8') as vocabulary_file:
+            words = vocabulary_file.read().split('\n')
+
+        vectors = QuantizedMatrix(*load_arrays(folder, 'vectors', mmap_mode))
+        ngram_buckets = ngram_vectors = None
+        if config['ngrams']:
+            ngram_buckets = np.load(os.path.join(folder, 'ngram_buckets.npy'), mmap_mode=mmap_mode)
+            ngram_vectors = QuantizedMatrix(*load_arrays(folder, 'ngram_vectors', mmap_mode))
+        return cls(words, vectors, ngram_buckets, ngram_vectors, config['min_n'], config['max_n'], config['bucket'])
+
+
+def load_arrays(folder, name, mmap_mode=None):
+    """Load a quantized array along with its scales if it has any."""
+    values = np.load(os.path.join(folder, f'{name}.npy'), mmap_mode=mmap_mode)
+    scales = None
+    if os.path.isfile(os.path.join(folder, f'{name}_scales.npy')):
+        scales = np.load(os.path.join(folder, f'{name}_scales.npy'), mmap_mode=mmap_mode)
+    return values, scales
+
+
+def save_arrays(folder, name, matrix, dtype):
+    """Save a float32 matrix as float16, or as int8 with the scale of each row saved alongside it."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype == 'float16':
+        np.save(os.path.join(folder, f'{name}.npy'), matrix.astype(np.float16))
+    elif dtype == 'int8':
+        scales = np.amax(np.abs(matrix), axis=1) / 127
+        scales[scales == 0] = 1
+        np.save(os.path.join(folder, f'{name}.npy'), np.round(matrix / scales[:, None]).astype(np.int8))
+        np.save(os.path.join(folder, f'{name}_scales.npy'), scales.astype(np.float32))
+    else:
+        raise ValueError(f'Unknown dtype {dtype}. Choose float16 or int8.')
+
+
+def compact_word_vectors(wv, folder, dtype='int8', ngrams='vocabulary'):
+    """Write a compact copy of FastText word vectors that the tagger can load instead of gensim.
+
+    dtype is 'float16' or 'int8'. ngrams decides which character n-gram buckets are kept for building the vectors of
+    unseen words: 'all' of them, only those used by words in the 'vocabulary', or None to keep none at all. Unseen
+    words then get the same zero vector as any other word without a vector."""
+    from gensim.models.fasttext import ft_ngram_hashes
+    os.makedirs(folder, exist_ok=True)
+    words = list(wv.index_to_key)
+    with open(os.path.join(folder, 'vocabulary.txt'), 'w', encoding='utf-8') as vocabulary_file:
+        vocabulary_file.write('\n'.join(words))
+    save_arrays(folder, 'vectors', wv.vectors, dtype)
+
+    bucket = getattr(wv, 'bucket', 0)
+    if ngrams and bucket:
+        if ngrams == 'all':
+            ngram_buckets = np.arange(bucket, dtype=np.int64)
+        elif ngrams == 'vocabulary':
+            used_buckets = set()
+            for word in words:
+                used_buckets.update(ft_ngram_hashes(word, wv.min_n, wv.max_n, bucket))
+            ngram_buckets = np.array(sorted(used_buckets), dtype=np.int64)
+        else:
+            raise ValueError(f'Unknown ngrams option {ngrams}. Choose all, vocabulary, or None.')
+        np.save(os.path.join(folder, 'ngram_buckets.npy'), ngram_buckets)
+        save_arrays(folder, 'ngram_vectors', wv.vectors_ngrams[ngram_buckets], dtype)
+
+    config = {'dtype': dtype, 'ngrams': bool(ngrams and bucket), 'min_n': getattr(wv, 'min_n', 3),
+              'max_n': getattr(wv, 'max_n', 6), 'bucket': bucket}
+    with open(os.path.join(folder, 'config.json'), 'w', encoding='utf-8') as json_file:
+        json.dump(config, json_file)
@@ -0,0 +1,68 @@
+import json
+import numpy as np
+import tensorflow as tf
+
+# Every array starts on a 64 byte boundary so it can be viewed straight out of the memory-mapped file
+alignment = 64
+magic = b'ANGELWTS'
+
+
+class WeightsFile:
+    """Read models out of a single weights file written by write_weights_file().
+
+    The file holds a JSON index followed by every weight array, uncompressed. It's memory-mapped, so opening it costs
+    next to nothing and each model's weights are only read from disk when that model is built."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as weights_file:
+            if weights_file.read(len(magic)) != magic:
+                raise ValueError(f'{path} is not an Angel weights file.')
+            header_length = int(np.frombuffer(weights_file.read(8), dtype='<u8')[0])
+            self.index = json.loads(weights_file.read(header_length).decode('utf-8'))
+        self.data_start = len(magic) + 8 + header_length
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def __contains__(self, name):
+        return name in self.index['models']
+
+    def weights(self, name):
+        """Return a model's weight arrays as read-only views into the file."""
+        arrays = []
+        for entry in self.index['models'][name]['weights']:
+            start = self.data_start + entry['offset']
+            arrays.append(self.buffer[start:start + entry['nbytes']].view(entry['dtype']).reshape(entry['shape']))
+        return arrays
+
+    def load(self, name):
+        """Build a model from its saved architecture and copy its weights in."""
+        model = tf.keras.models.model_from_json(self.index['models'][name]['config'])
+        model.set_weights(self.weights(name))
+        return model
+
+
+def write_weights_file(models, path):
+    """Pack a dict of names to Keras models into one aligned, uncompressed weights file."""
+    index = {'version': 1, 'models': {}}
+    arrays = []
+    offset = 0
+    for name, model in models.items():
+        entries = []
+        for array in model.get_weights():
+            array = np.ascontiguousarray(array)
+            entries.append({'offset': offset, 'nbytes': array.nbytes, 'dtype': array.dtype.str,
+                            'shape': list(array.shape)})
+            arrays.append(array)
+            offset += -(-array.nbytes // alignment) * alignment
+        index['models'][name] = {'config': model.to_json(), 'weights': entries}
+
+    # Offsets are from the start of the data, which begins at the first aligned byte after the header
+    header = json.dumps(index).encode('utf-8')
+    header += b' ' * (-(len(magic) + 8 + len(header)) % alignment)
+
+    with open(path, 'wb') as weights_file:
+        weights_file.write(magic)
+        weights_file.write(np.array([len(header)], dtype='<u8').tobytes())
+        weights_file.write(header)
+        for array in arrays:
+            weights_file.write(array.tobytes())
+            weights_file.write(b'\0' * (-array.nbytes % alignment))
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import tempfile
+import argparse
+import subprocess
+
+# This module stays outside the angel package so that running it never imports TensorFlow or loads any models
+
+
+def default_socket_path():
+    """Return a per-user socket path for the tagging daemon."""
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir()), f'angel-{os.getuid()}.sock')
+
+
+def connect(path, idle_timeout=600, start_timeout=300):
+    """Connect to the tagging daemon, starting it first if it isn't running."""
+    try:
+        return open_socket(path)
+    except OSError:
+        pass
+
+    # Only one client starts the daemon. The rest wait on the lock and then find it running.
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return open_socket(path)
+        except OSError:
+            pass
+        with open(f'{path}.log', 'a') as log_file:
+            subprocess.Popen([sys.executable, '-m', 'angel', 'daemon', '--socket', path, '--idle-timeout',
+                              str(idle_timeout)], stdin=subprocess.DEVNULL, stdout=log_file, stderr=log_file,
+                             start_new_session=True)
+        deadline = time.monotonic() + start_timeout
+        while True:
+            try:
+                return open_socket(path)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'The tagging daemon did not start. See {path}.log.')
+                time.sleep(0.1)
+
+
+def open_socket(path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        raise
+    return client
+
+
+def tag_text(text, path=None, annotator='Vanessa Gorman', idle_timeout=600):
+    """Send text to the tagging daemon and yield (token, tag) pairs as they arrive.
+
+    Raises ValueError if the daemon rejects the request, RuntimeError if tagging fails, and ConnectionError if the
+    daemon stops answering before the end of the results."""
+    path = path or default_socket_path()
+    client = connect(path, idle_timeout)
+    with client, client.makefile('rb') as replies:
+        client.sendall(json.dumps({'text': text, 'annotator': annotator}, ensure_ascii=False).encode('utf-8') + b'\n')
+        for line in replies:
+            reply = json.loads(line.decode('utf-8'))
+            if isinstance(reply, dict):
+                if reply.get('done'):
+                    return
+                raise (RuntimeError if reply.get('internal') else ValueError)(reply.get('error'))
+            yield tuple(reply)
+    raise ConnectionError(f'The tagging daemon closed the connection before finishing. See {path}.log.')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='angel-client', description='Tag files or stdin through a warm tagging '
+                                     'daemon, starting it if needed. Prints one token and its tag per line.')
+    parser.add_argument('files', nargs='*', help='Files to tag. Reads stdin if none are given.')
+    parser.add_argument('--socket', default=default_socket_path())
+    parser.add_argument('--annotator', default='Vanessa Gorman')
+    parser.add_argument('--idle-timeout', type=float, default=600,
+                        help='Seconds the daemon stays up without requests once this starts it. Default 600.')
+    args = parser.parse_args()
+    if args.idle_timeout <= 0:
+        parser.error('--idle-timeout must be more than 0 seconds.')
+
+    for file in args.files or ['-']:
+        if file == '-':
+            text = sys.stdin.read()
+        else:
+            with open(file, encoding='utf-8') as infile:
+                text = infile.read()
+        for token, tag in tag_text(text, args.socket, args.annotator, args.idle_timeout):
+            sys.stdout.write(f'{token}\t{tag}\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import os
+import time
+from bs4 import BeautifulSoup
+import numpy as np
+from angel import create_morph_classes, predict_morphs, pos_carriers
+
+
+def is_correct(predicted_tag, correct_tag):
+    """Score a tag the same way 12_testing.py does."""
+    return predicted_tag == correct_tag or (predicted_tag == '-' and correct_tag == '_')
+
+
+def score(aspect, predicted_tags):
+    """Return how many of an aspect's predicted tags match the treebank."""
+    return sum(is_correct(predicted, correct) for predicted, correct in zip(predicted_tags, aspect.correct_tags))
+
+
+def tags_from_outputs(aspect, outputs):
+    """Turn an array of softmax outputs into a list of tags."""
+    predicted_tags = []
+    for tensor in outputs:
+        try:
+            predicted_tags.append(aspect.tags[int(np.argmax(tensor))])
+        except IndexError:
+            predicted_tags.append('-')
+    return predicted_tags
+
+
+print('Loading models...')
+morphs = create_morph_classes()
+
+# Gather stage 2 and stage 3 outputs over the same held-out files that 12_testing.py uses
+corpora = os.path.join('data', 'corpora', 'greek', 'annotated', 'gorman')
+all_correct_tags = {aspect.title: [] for aspect in morphs}
+all_output2 = {aspect.title: [] for aspect in morphs}
+all_output3 = {aspect.title: [] for aspect in morphs}
+documents = []
+total_tokens = 0
+full_seconds = 0
+full_lstm2_windows = 0
+full_dnn_rows = 0
+
+for test_file in sorted(os.listdir(corpora))[:5]:
+    xml_file = open(os.path.join(corpora, test_file), 'r', encoding='utf-8')
+    soup = BeautifulSoup(xml_file, 'xml')
+    split_text = []
+    correct_tags = [[] for _ in morphs]
+    for sentence in soup.find_all('sentence'):
+        for token in sentence.find_all(['word', 'token']):
+            if token.has_attr('form') and token.has_attr('postag') and token.has_attr('artificial') is False and \
+                    len(token['postag']) == 9:
+                split_text.append(token['form'])
+                for i, tag in enumerate(token['postag']):
+                    correct_tags[i].append(tag)
+
+    print(f'{test_file}: {len(split_text)} tokens.')
+    documents.append(split_text)
+    start_time = time.perf_counter()
+    predict_morphs(split_text, morphs)
+    full_seconds += time.perf_counter() - start_time
+    full_lstm2_windows += sum(aspect.lstm2_windows for aspect in morphs)
+    full_dnn_rows += sum(aspect.dnn_rows for aspect in morphs)
+    total_tokens += len(split_text)
+    for i, aspect in enumerate(morphs):
+        all_correct_tags[aspect.title] += correct_tags[i]
+        all_output2[aspect.title].append(aspect.output2)
+        all_output3[aspect.title].append(aspect.output3)
+
+for aspect in morphs:
+    aspect.correct_tags = all_correct_tags[aspect.title]
+    aspect.output2 = np.concatenate(all_output2[aspect.title])
+    aspect.output3 = np.concatenate(all_output3[aspect.title])
+    aspect.predicted_tags2 = tags_from_outputs(aspect, aspect.output2)
+    aspect.predicted_tags3 = tags_from_outputs(aspect, aspect.output3)
+    aspect.total_correct = score(aspect, aspect.predicted_tags3)
+
+print('\nFull pipeline')
+for aspect in morphs:
+    print(f'{aspect.title} correct: {aspect.total_correct}/{total_tokens} = {aspect.total_correct/total_tokens:.02%}')
+
+# Confidence-gated cascade. Skipping a window never changes the context the other windows see, so every threshold can
+# be scored from a single full run.
+max_loss = 0.0005
+candidate_thresholds = (0.9, 0.95, 0.97, 0.98, 0.99, 0.995, 0.998, 0.999, 0.9995, 0.9999)
+calibrated = {}
+windows_skipped = 0
+cascade_correct = 0
+print(f'\nCascade calibration (largest accuracy loss allowed: {max_loss:.02%})')
+for aspect in morphs:
+    confidence2 = np.amax(aspect.output2, axis=1)
+    calibrated[aspect.title] = 1.0
+    for threshold in candidate_thresholds:
+        confident = confidence2 >= threshold
+        cascade_tags = [tag2 if sure else tag3 for tag2, tag3, sure in
+                        zip(aspect.predicted_tags2, aspect.predicted_tags3, confident)]
+        change = (score(aspect, cascade_tags) - aspect.total_correct)/total_tokens
+        print(f'{aspect.title} >= {threshold}: skips {np.mean(confident):.02%} of LSTM2 windows, '
+              f'accuracy change {change:+.03%}')
+        if -change <= max_loss and threshold < calibrated[aspect.title]:
+            calibrated[aspect.title] = threshold
+
+    # Tally the work saved and accuracy kept at the chosen threshold
+    confident = confidence2 >= calibrated[aspect.title]
+    windows_skipped += int(np.sum(confident))
+    cascade_correct += score(aspect, [tag2 if sure else tag3 for tag2, tag3, sure in
+                                      zip(aspect.predicted_tags2, aspect.predicted_tags3, confident)])
+
+full_correct = sum(aspect.total_correct for aspect in morphs)
+print(f'\nCalibrated cascade skips {windows_skipped/(total_tokens*len(morphs)):.02%} of LSTM2 windows. Accuracy across '
+      f'all aspects goes from {full_correct/(total_tokens*len(morphs)):.02%} to '
+      f'{cascade_correct/(total_tokens*len(morphs)):.02%}.')
+print(f'cascade_thresholds = {calibrated}')
+
+# Part-of-speech gating. Part-of-speech runs in full either way, so gating can also be scored from the full run.
+pos = morphs[0]
+windows_skipped = 0
+gated_correct = pos.total_correct
+print('\nPart-of-speech gating')
+for aspect in morphs[1:]:
+    carriers = [pos_tag in pos_carriers[aspect.title] for pos_tag in pos.predicted_tags3]
+    gated_tags = [tag3 if carrier else '-' for tag3, carrier in zip(aspect.predicted_tags3, carriers)]
+    aspect_correct = score(aspect, gated_tags)
+    gated_correct += aspect_correct
+    windows_skipped += total_tokens - sum(carriers)
+    print(f'{aspect.title}: skips {1 - sum(carriers)/total_tokens:.02%} of LSTM2 windows, accuracy change '
+          f'{(aspect_correct - aspect.total_correct)/total_tokens:+.03%}')
+
+print(f'\nPart-of-speech gating skips {windows_skipped/(total_tokens*len(morphs)):.02%} of LSTM2 windows. Accuracy '
+      f'across all aspects goes from {full_correct/(total_tokens*len(morphs)):.02%} to '
+      f'{gated_correct/(total_tokens*len(morphs)):.02%}.')
+
+# Confidence-ordered refinement changes the context LSTM2 sees, so it needs its own run
+refined_tags = {aspect.title: [] for aspect in morphs}
+refined_seconds = 0
+refined_lstm2_windows = 0
+refined_dnn_rows = 0
+for split_text in documents:
+    start_time = time.perf_counter()
+    predict_morphs(split_text, morphs, refine=True)
+    refined_seconds += time.perf_counter() - start_time
+    refined_lstm2_windows += sum(aspect.lstm2_windows for aspect in morphs)
+    refined_dnn_rows += sum(aspect.dnn_rows for aspect in morphs)
+    for aspect in morphs:
+        refined_tags[aspect.title] += aspect.predicted_tags3
+
+refined_correct = 0
+print('\nConfidence-ordered refinement')
+for aspect in morphs:
+    aspect_correct = score(aspect, refined_tags[aspect.title])
+    refined_correct += aspect_correct
+    print(f'{aspect.title}: accuracy change {(aspect_correct - aspect.total_correct)/total_tokens:+.03%}')
+
+gain = (refined_correct - full_correct)/(total_tokens*len(morphs))
+extra_compute = (refined_lstm2_windows + refined_dnn_rows)/(full_lstm2_windows + full_dnn_rows) - 1
+print(f'\nRefinement ran {refined_lstm2_windows/full_lstm2_windows:.02f}x the LSTM2 windows, '
+      f'{refined_dnn_rows/full_dnn_rows:.02f}x the DNN rows, and took {refined_seconds/full_seconds:.02f}x as long.')
+print(f'Accuracy across all aspects changed {gain:+.03%}, or {gain/max(extra_compute, 1e-9):+.03%} per 100% of '
+      f'extra model rows.')
@@ -0,0 +1,67 @@
+import os
+import time
+import random
+from bs4 import BeautifulSoup
+from greek_normalisation.normalise import Normaliser
+from angel import normalize_form, normalize_tokens, settled_word_pattern, greek_letters
+
+
+def reference_normalize(word):
+    """Normalize a token the way the tagger originally did."""
+    return normalise(word.replace("\u02BC", "\u2019").replace("\u1FBF", "\u2019").replace("\u0027", "\u2019").
+                     replace("\u1FBD", "\u2019"))[0]
+
+
+normalise = Normaliser().normalise
+
+# Gather every running token in the treebanks
+agdt_folder = os.path.join('data', 'corpora', 'greek', 'annotated', 'perseus-771dca2', 'texts')
+gorman_folder = os.path.join('data', 'corpora', 'greek', 'annotated', 'gorman')
+running_tokens = []
+for folder in (agdt_folder, gorman_folder):
+    for file in sorted(os.listdir(folder)):
+        if file[-4:] == '.xml':
+            xml_file = open(os.path.join(folder, file), 'r', encoding='utf-8')
+            soup = BeautifulSoup(xml_file, 'xml')
+            for token in soup.find_all(['word', 'token']):
+                if token.has_attr('form'):
+                    running_tokens.append(token['form'])
+unique_forms = sorted(set(running_tokens))
+print(f'{len(running_tokens)} running tokens and {len(unique_forms)} unique forms.')
+
+# Every form in the treebanks must come out exactly as it used to
+mismatches = [form for form in unique_forms if normalize_form(form) != reference_normalize(form)]
+for form in mismatches[:20]:
+    print(f'Mismatch: {form!r} gave {normalize_form(form)!r} instead of {reference_normalize(form)!r}')
+print(f'{len(unique_forms) - len(mismatches)}/{len(unique_forms)} unique forms match.')
+settled_forms = sum(bool(settled_word_pattern.fullmatch(form)) for form in unique_forms)
+print(f'{settled_forms}/{len(unique_forms)} unique forms skip Normaliser as already normalized.')
+
+# Words the treebanks never use, built out of every Greek letter, capital, and combining accent, with graves, elisions,
+# and unaccented clitics mixed in, must also come out the same
+generator = random.Random(0)
+characters = greek_letters + [letter.upper() for letter in greek_letters] + ['\u0300', '\u0301', '\u0342', '\u2019']
+weights = [1] * len(greek_letters) + [0.02] * len(greek_letters) + [2] * 4
+clitics = ['ὁ', 'οὐκ', 'ἐξ', 'μου', 'τις', 'εἰμι', 'ἀλλ’', 'δ’', 'ἐστὶ', 'τινὲς']
+random_forms = [generator.choice(clitics) if generator.random() < 0.1 else
+                ''.join(generator.choices(characters, weights, k=generator.randint(1, 12))) for _ in range(200000)]
+random_mismatches = [form for form in random_forms if normalize_form(form) != reference_normalize(form)]
+for form in random_mismatches[:20]:
+    print(f'Mismatch: {form!r} gave {normalize_form(form)!r} instead of {reference_normalize(form)!r}')
+print(f'{len(random_forms) - len(random_mismatches)}/{len(random_forms)} random forms match, '
+      f'{sum(bool(settled_word_pattern.fullmatch(form)) for form in random_forms)} of them skipping Normaliser.')
+
+# Compare speed over the running tokens, starting the new normalizer with an empty cache
+start_time = time.perf_counter()
+reference_forms = [reference_normalize(token) for token in running_tokens]
+reference_seconds = time.perf_counter() - start_time
+
+normalize_form.cache_clear()
+start_time = time.perf_counter()
+fast_forms = normalize_tokens(running_tokens)
+fast_seconds = time.perf_counter() - start_time
+
+assert fast_forms == reference_forms
+print(f'Original normalization: {len(running_tokens)/reference_seconds:,.0f} tokens/s')
+print(f'Memoized normalization: {len(running_tokens)/fast_seconds:,.0f} tokens/s '
+      f'({reference_seconds/fast_seconds:.01f}x, {normalize_form.cache_info()})')
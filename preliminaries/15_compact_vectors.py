@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+from bs4 import BeautifulSoup
+import angel
+from gensim.models import KeyedVectors
+from angel import create_morph_classes, predict_morphs, load_word_vectors
+from angel.vectors import compact_word_vectors
+
+
+def is_correct(predicted_tag, correct_tag):
+    """Score a tag the same way 12_testing.py does."""
+    return predicted_tag == correct_tag or (predicted_tag == '-' and correct_tag == '_')
+
+
+def measure_load(folder):
+    """Load a set of word vectors in a fresh interpreter and return its load time in seconds and peak RSS in MB."""
+
+    # Importing vectors.py by itself keeps the angel package, TensorFlow, and the default vectors out of the count
+    # ru_maxrss survives exec on Linux and would report this process's peak, so read the child's own high-water mark
+    code = ('import sys, time\n'
+            'start_time = time.perf_counter()\n'
+            f'sys.path.insert(0, {os.path.dirname(angel.__file__)!r})\n'
+            'from vectors import CompactVectors\n'
+            f'if {folder!r}.endswith("compact_vectors"):\n'
+            f'    wv = CompactVectors.load({folder!r})\n'
+            'else:\n'
+            '    from gensim.models import KeyedVectors\n'
+            f'    wv = KeyedVectors.load({folder!r})\n'
+            'seconds = time.perf_counter() - start_time\n'
+            'status = dict(line.split(":", 1) for line in open("/proc/self/status"))\n'
+            'print(seconds, int(status["VmHWM"].split()[0]) / 1024)\n')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    seconds, megabytes = output.split()
+    return float(seconds), float(megabytes)
+
+
+def folder_size(path):
+    """Return the size on disk of a file, or of every file in a folder, in MB."""
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 2**20
+    return sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path)) / 2**20
+
+
+# Gather the same held-out files that 12_testing.py uses
+corpora = os.path.join('data', 'corpora', 'greek', 'annotated', 'gorman')
+documents = []
+for test_file in sorted(os.listdir(corpora))[:5]:
+    xml_file = open(os.path.join(corpora, test_file), 'r', encoding='utf-8')
+    soup = BeautifulSoup(xml_file, 'xml')
+    split_text = []
+    correct_tags = []
+    for sentence in soup.find_all('sentence'):
+        for token in sentence.find_all(['word', 'token']):
+            if token.has_attr('form') and token.has_attr('postag') and token.has_attr('artificial') is False and \
+                    len(token['postag']) == 9:
+                split_text.append(token['form'])
+                correct_tags.append(token['postag'])
+    documents.append((split_text, correct_tags))
+
+print('Loading models...')
+morphs = create_morph_classes()
+gensim_file = os.path.join(angel.model_folder, 'fasttext.wordvectors')
+gensim_vectors = KeyedVectors.load(gensim_file)
+
+
+def accuracy():
+    """Return the share of tags across all aspects that match the treebank."""
+    correct = 0
+    total = 0
+    for split_text, correct_tags in documents:
+        predict_morphs(split_text, morphs)
+        for i, aspect in enumerate(morphs):
+            correct += sum(is_correct(predicted, tags[i]) for predicted, tags in zip(aspect.predicted_tags3,
+                                                                                     correct_tags))
+            total += len(correct_tags)
+    return correct / total
+
+
+# The vector files gensim writes alongside fasttext.wordvectors count toward its size
+gensim_size = sum(folder_size(os.path.join(angel.model_folder, file)) for file in os.listdir(angel.model_folder)
+                  if file.startswith('fasttext.wordvectors'))
+gensim_seconds, gensim_rss = measure_load(gensim_file)
+angel.wv = gensim_vectors
+angel.oov_vector.cache_clear()
+gensim_accuracy = accuracy()
+print(f'\ngensim: {gensim_size:,.0f} MB on disk, loads in {gensim_seconds:.02f}s, peak RSS {gensim_rss:,.0f} MB, '
+      f'accuracy {gensim_accuracy:.03%}')
+
+for dtype in ('float16', 'int8'):
+    for ngrams in ('all', 'vocabulary', None):
+        folder = os.path.join('data', 'compact', f'{dtype}-{ngrams}', 'compact_vectors')
+        compact_word_vectors(gensim_vectors, folder, dtype, ngrams)
+        seconds, rss = measure_load(folder)
+        angel.wv = load_word_vectors(os.path.dirname(folder))
+        angel.oov_vector.cache_clear()
+        change = accuracy() - gensim_accuracy
+        print(f'{dtype}, {ngrams} n-grams: {folder_size(folder):,.0f} MB on disk, loads in {seconds:.02f}s, '
+              f'peak RSS {rss:,.0f} MB, accuracy change {change:+.03%}')
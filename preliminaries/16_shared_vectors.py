@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import angel
+
+# Start several workers which each load the word vectors and read every row of them, then compare how much of each
+# worker's memory is shared with the others and how much is its own. Linux only, since it reads /proc/<pid>/smaps_rollup.
+workers = 4
+worker_code = '''
+import os, sys
+import numpy as np
+sys.path.insert(0, {angel_folder!r})
+from vectors import CompactVectors
+from gensim.models import KeyedVectors
+
+folder = {folder!r}
+mmap = {mmap!r}
+if folder.endswith('compact_vectors'):
+    wv = CompactVectors.load(folder, mmap_mode=mmap)
+    arrays = [wv.vectors.values, wv.ngram_vectors.values if wv.ngram_vectors is not None else np.zeros((0, 1))]
+else:
+    wv = KeyedVectors.load(folder, mmap=mmap)
+    arrays = [wv.vectors, wv.vectors_ngrams]
+
+# Touch every page, a slice at a time so no large temporary array is made
+for array in arrays:
+    for start in range(0, len(array), 65536):
+        np.sum(array[start:start + 65536])
+print('ready', flush=True)
+sys.stdin.readline()
+'''
+
+
+def memory(pid):
+    """Return the RSS, PSS, shared, and private memory of a process in MB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return (fields['Rss'], fields['Pss'], fields['Shared_Clean'] + fields['Shared_Dirty'],
+            fields['Private_Clean'] + fields['Private_Dirty'])
+
+
+def run_workers(folder, mmap):
+    """Start the workers, wait until each has read all its vectors, and return each one's memory."""
+    code = worker_code.format(angel_folder=os.path.dirname(angel.__file__), folder=folder, mmap=mmap)
+    processes = [subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                  text=True) for _ in range(workers)]
+    for process in processes:
+        assert process.stdout.readline().strip() == 'ready'
+    usage = np.array([memory(process.pid) for process in processes])
+    for process in processes:
+        process.communicate('\n')
+    return usage
+
+
+stores = [os.path.join(angel.model_folder, 'fasttext.wordvectors')]
+if os.path.isdir(os.path.join(angel.model_folder, 'compact_vectors')):
+    stores.append(os.path.join(angel.model_folder, 'compact_vectors'))
+
+for store in stores:
+    print(f'\n{os.path.basename(store)}, {workers} workers')
+    private = {}
+    for mmap in (None, 'r'):
+        rss, pss, shared, private[mmap] = run_workers(store, mmap).mean(axis=0)
+        print(f'mmap={mmap}: RSS {rss:,.0f} MB, PSS {pss:,.0f} MB, shared {shared:,.0f} MB, private {private[mmap]:,.0f} '
+              f'MB per worker')
+
+    # Each memory-mapped worker should keep less to itself than the copy every private worker holds
+    assert private['r'] < private[None], 'Memory-mapped workers did not share their vectors.'
+    print(f'Memory mapping saves {private[None] - private["r"]:,.0f} MB of private memory per worker, '
+          f'{(private[None] - private["r"])*(workers - 1):,.0f} MB across {workers} workers.')
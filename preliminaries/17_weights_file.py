@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import angel
+
+# Time create_morph_classes() in fresh interpreters, once loading the 27 HDF5 files and once loading the single
+# weights file. Importing angel happens before the clock starts, so only model loading is timed.
+repeats = 5
+timing_code = '''
+import time
+import angel
+if not {packed}:
+    angel.weights_path = None
+start_time = time.perf_counter()
+angel.create_morph_classes(aspects={aspects!r})
+print(time.perf_counter() - start_time)
+'''
+
+
+def cold_start(packed, aspects=None):
+    """Return the median seconds create_morph_classes() takes in a fresh interpreter."""
+    seconds = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', timing_code.format(packed=packed, aspects=aspects)],
+                                capture_output=True, text=True, check=True).stdout
+        seconds.append(float(output.split()[-1]))
+    return float(np.median(seconds))
+
+
+if not os.path.isfile(angel.weights_path):
+    angel.pack_model_weights()
+hdf5_size = sum(os.path.getsize(os.path.join(angel.model_folder, file)) for stage_files in angel.model_files.values()
+                for file in stage_files)
+print(f'27 HDF5 files: {hdf5_size/2**20:,.1f} MB. Weights file: {os.path.getsize(angel.weights_path)/2**20:,.1f} MB.')
+
+# The packed models must give exactly the same outputs
+angel.weights_path = None
+hdf5_morphs = angel.create_morph_classes()
+angel.weights_path = os.path.join(angel.model_folder, 'angel.weights')
+packed_morphs = angel.create_morph_classes()
+lstm1_input = np.random.rand(32, 21, 174).astype(np.float32)
+dnn_input = np.random.rand(32, 92).astype(np.float32)
+lstm2_input = np.random.rand(32, 15, 192).astype(np.float32)
+for hdf5_aspect, packed_aspect in zip(hdf5_morphs, packed_morphs):
+    for stage, model_input in (('lstm1', lstm1_input), ('dnn', dnn_input), ('lstm2', lstm2_input)):
+        assert np.array_equal(getattr(hdf5_aspect, stage).predict_on_batch(model_input),
+                              getattr(packed_aspect, stage).predict_on_batch(model_input)), \
+            f'{hdf5_aspect.title} {stage} differs'
+print('Every packed model gives the same outputs as its HDF5 file.')
+
+for aspects in (None, ['pos']):
+    hdf5_seconds = cold_start(False, aspects)
+    packed_seconds = cold_start(True, aspects)
+    print(f'create_morph_classes(aspects={aspects}): HDF5 files {hdf5_seconds:.02f}s, weights file '
+          f'{packed_seconds:.02f}s ({hdf5_seconds/packed_seconds:.01f}x)')
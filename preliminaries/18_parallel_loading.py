@@ -0,0 +1,32 @@
+import subprocess
+import sys
+import numpy as np
+
+# Time create_morph_classes() in fresh interpreters with different numbers of loading threads, and list how long each
+# model took with the slowest first
+repeats = 3
+timing_code = '''
+import time
+import angel
+start_time = time.perf_counter()
+morphs = angel.create_morph_classes(workers={workers})
+print(time.perf_counter() - start_time)
+for aspect in morphs:
+    for stage, seconds in aspect.load_seconds.items():
+        print(f'{{aspect.title}}-{{stage}}', seconds)
+'''
+
+for workers in (1, 2, 4, 8):
+    totals = []
+    model_seconds = {}
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', timing_code.format(workers=workers)], capture_output=True,
+                                text=True, check=True).stdout.split('\n')
+        lines = [line.split() for line in output if len(line.split()) in (1, 2)]
+        start = max(i for i, line in enumerate(lines) if len(line) == 1)
+        totals.append(float(lines[start][0]))
+        for name, seconds in lines[start + 1:]:
+            model_seconds.setdefault(name, []).append(float(seconds))
+    print(f'\n{workers} threads: {np.median(totals):.02f}s for all 27 models')
+    slowest = sorted(model_seconds, key=lambda name: -np.median(model_seconds[name]))
+    print(', '.join(f'{name} {np.median(model_seconds[name]):.02f}s' for name in slowest))
@@ -0,0 +1,136 @@
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import angel
+from angel.store import write_manifest, install_models, install_archive, models_installed, verify_models, partial_folder
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serve a folder like a mirror would, honouring Range headers so resumed downloads can be checked."""
+    def send_head(self):
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+        start = int(match.group(1))
+        size = os.path.getsize(path)
+        if start >= size:
+            self.send_error(416)
+            return None
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        self.send_header('Content-Length', str(size - start))
+        self.end_headers()
+        infile = open(path, 'rb')
+        infile.seek(start)
+        return infile
+
+    def log_message(self, *args):
+        pass
+
+
+work_folder = tempfile.mkdtemp()
+
+# Build a mirror out of the installed models
+mirror = os.path.join(work_folder, 'mirror')
+shutil.copytree(angel.model_folder, mirror, ignore=shutil.ignore_patterns('manifest.json', partial_folder))
+manifest = write_manifest(mirror)
+components = sorted({entry['component'] for entry in manifest['files'].values()})
+print(f'Mirror holds {len(manifest["files"])} files in {len(components)} components: {", ".join(components)}')
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), partial(RangeRequestHandler, directory=mirror))
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = f'http://127.0.0.1:{server.server_port}'
+
+# Install everything over HTTP
+target = os.path.join(work_folder, 'http_install')
+start_time = time.perf_counter()
+install_models(target, url)
+print(f'HTTP install took {time.perf_counter() - start_time:.02f}s')
+assert models_installed(target, angel.required_model_files())
+assert verify_models(target) == []
+
+# Install one component, then the rest. The second install should only fetch what is still missing.
+target = os.path.join(work_folder, 'component_install')
+install_models(target, url, components=['vectors'])
+assert not models_installed(target, angel.required_model_files())
+install_models(target, url)
+assert models_installed(target, angel.required_model_files())
+
+# An interrupted download resumes from its .part file. Pretend the biggest file stopped halfway.
+biggest = max(manifest['files'], key=lambda path: manifest['files'][path]['size'])
+os.remove(os.path.join(target, biggest))
+part_path = os.path.join(target, partial_folder, f'{biggest}.part')
+os.makedirs(os.path.dirname(part_path), exist_ok=True)
+with open(os.path.join(mirror, biggest), 'rb') as infile, open(part_path, 'wb') as outfile:
+    outfile.write(infile.read(manifest['files'][biggest]['size'] // 2))
+assert not models_installed(target, angel.required_model_files())
+install_models(target, url)
+assert verify_models(target) == []
+print(f'Resumed {biggest} from halfway.')
+
+# A damaged file is caught and repaired
+damaged = os.path.join(target, biggest)
+with open(damaged, 'r+b') as outfile:
+    outfile.write(b'\0' * 16)
+assert verify_models(target) == [biggest]
+install_models(target, url, verify=True)
+assert verify_models(target) == []
+print(f'Repaired {biggest}.')
+
+# A corrupt mirror is refused without touching the installed copy
+with open(os.path.join(mirror, biggest), 'r+b') as outfile:
+    outfile.write(b'\0' * 16)
+os.remove(os.path.join(target, biggest))
+try:
+    install_models(target, url)
+    raise AssertionError('A corrupt mirror file was installed.')
+except RuntimeError as error:
+    print(f'Refused corrupt mirror: {error}')
+assert not os.path.isfile(os.path.join(target, biggest))
+shutil.copyfile(os.path.join(angel.model_folder, biggest), os.path.join(mirror, biggest))
+
+# Local folder and tar archive mirrors
+for source in ('folder', 'archive'):
+    target = os.path.join(work_folder, f'{source}_install')
+    if source == 'archive':
+        archive = os.path.join(work_folder, 'mirror.tar')
+        with tarfile.open(archive, 'w') as tar:
+            for path in os.listdir(mirror):
+                tar.add(os.path.join(mirror, path), arcname=path)
+        source_path = archive
+    else:
+        source_path = mirror
+    start_time = time.perf_counter()
+    install_models(target, source_path)
+    print(f'{source.capitalize()} mirror install took {time.perf_counter() - start_time:.02f}s')
+    assert verify_models(target) == []
+
+# An archive without a manifest, like the original one, unpacks whole. Compact vectors made afterwards are never in the
+# manifest, so they only need to be there.
+target = os.path.join(work_folder, 'plain_archive_install')
+archive = os.path.join(work_folder, 'plain.tar')
+with tarfile.open(archive, 'w') as tar:
+    for path in angel.downloaded_model_files():
+        tar.add(os.path.join(mirror, path), arcname=path)
+install_archive(target, archive, angel.downloaded_model_files())
+compact_required = ['compact_vectors/config.json'] + angel.downloaded_model_files()[1:]
+assert models_installed(target, angel.downloaded_model_files())
+assert not models_installed(target, compact_required)
+os.makedirs(os.path.join(target, 'compact_vectors'))
+with open(os.path.join(target, 'compact_vectors', 'config.json'), 'w') as outfile:
+    outfile.write('{}')
+assert models_installed(target, compact_required)
+install_archive(target, archive, angel.downloaded_model_files())
+assert os.path.isfile(os.path.join(target, 'compact_vectors', 'config.json'))
+print('Compact vectors made locally count as installed and survive a reinstall.')
+
+server.shutdown()
+shutil.rmtree(work_folder)
+print('Model store checks passed.')
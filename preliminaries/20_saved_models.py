@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import angel
+
+# Compare first-request latency after a restart with steady-state latency for the HDF5 models and for exported
+# SavedModels, both per aspect and fused. Each run happens in a fresh interpreter so nothing is already traced.
+requests = 20
+timing_code = '''
+import time
+import numpy as np
+import angel
+angel.saved_models_path = {saved_models_path!r}
+start_time = time.perf_counter()
+morphs = angel.create_morph_classes()
+load_seconds = time.perf_counter() - start_time
+split_text = angel.tokenize({text!r})[0]
+seconds = []
+for _ in range({requests}):
+    start_time = time.perf_counter()
+    angel.predict_morphs(split_text, morphs)
+    seconds.append(time.perf_counter() - start_time)
+print(load_seconds, seconds[0], np.median(seconds[1:]))
+'''
+
+# A request of a couple of sentences, the kind a web service sees
+text = 'ὧν ἐς πολὺ καὶ τὸ ἐμὸν ὄνομα μετὰ τῶν ἄλλων ἐνδοξοτάτων ἀνδρῶν. ἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ λάθῃ. ' * 2
+
+fused_path = os.path.join(angel.model_folder, 'saved_models_fused')
+if not os.path.isfile(os.path.join(angel.saved_models_path, 'config.json')):
+    angel.export_models()
+if not os.path.isfile(os.path.join(fused_path, 'config.json')):
+    angel.export_models(fused_path, fused=True)
+
+for label, saved_models_path in (('HDF5 models', None), ('SavedModels', angel.saved_models_path),
+                                 ('Fused SavedModels', fused_path)):
+    output = subprocess.run([sys.executable, '-c', timing_code.format(saved_models_path=saved_models_path, text=text,
+                                                                      requests=requests)],
+                            capture_output=True, text=True, check=True).stdout
+    load_seconds, first_seconds, steady_seconds = (float(number) for number in output.split('\n')[-2].split())
+    print(f'{label}: load {load_seconds:.02f}s, first request {first_seconds*1000:,.0f} ms, steady state '
+          f'{steady_seconds*1000:,.0f} ms')
@@ -0,0 +1,78 @@
+import json
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+
+# Start `angel serve` with batching turned off and with different batching windows, and hit it with many small
+# concurrent requests, as a web app tagging single sentences would. Reports throughput and latency for each.
+port = 8765
+clients = 16
+requests_per_client = 25
+sentences = ['ὧν ἐς πολὺ καὶ τὸ ἐμὸν ὄνομα μετὰ τῶν ἄλλων ἐνδοξοτάτων ἀνδρῶν.', 'ἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ λάθῃ.',
+             'οἱ μὲν οὖν Ἀθηναῖοι ἐπολέμουν τοῖς Λακεδαιμονίοις.', 'λέγει δὲ ὁ Σωκράτης ὅτι οὐδὲν οἶδεν.']
+
+
+def get(path):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}') as response:
+        return json.loads(response.read())
+
+
+def post(text):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/tag', data=json.dumps({'text': text}).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def client(latencies, requests=requests_per_client):
+    for i in range(requests):
+        start_time = time.perf_counter()
+        post(sentences[i % len(sentences)])
+        latencies.append(time.perf_counter() - start_time)
+
+
+def run_clients(requests):
+    """Run every client at once and return each request's latency along with the seconds they all took."""
+    latencies = []
+    threads = [threading.Thread(target=client, args=(latencies, requests)) for _ in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start_time
+
+
+# A max of one token per batch turns batching off
+for label, max_wait, max_tokens in (('no batching', 0, 1), ('max wait 5 ms', 0.005, 4096),
+                                    ('max wait 20 ms', 0.02, 4096)):
+    server = subprocess.Popen([sys.executable, '-m', 'angel', 'serve', '--port', str(port), '--max-wait',
+                               str(max_wait), '--max-tokens', str(max_tokens)], stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        # The health check answers straight away and readiness once the models are loaded
+        while True:
+            try:
+                assert get('/health')['status'] == 'ok'
+                get('/ready')
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+
+        # Warm up first so that every batch size TensorFlow will see has already been traced
+        run_clients(5)
+        warm_stats = get('/ready')
+        latencies, seconds = run_clients(requests_per_client)
+        stats = get('/ready')
+        batches = stats['batches'] - warm_stats['batches']
+        tokens = stats['tokens'] - warm_stats['tokens']
+        print(f'{label}: {len(latencies)/seconds:,.1f} requests/s, {tokens/seconds:,.0f} tokens/s, latency p50 '
+              f'{np.percentile(latencies, 50)*1000:,.0f} ms p95 {np.percentile(latencies, 95)*1000:,.0f} ms, '
+              f'{len(latencies)/batches:.01f} requests per batch')
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+from angel.batching import Tagger
+
+# Check that atag() keeps the event loop responsive, coalesces concurrent callers, holds back callers past the
+# max_pending limit whether they come through atag() or tag(), and drops the work of callers who are cancelled before
+# their batch starts
+callers = 200
+sentences = ['ὧν ἐς πολὺ καὶ τὸ ἐμὸν ὄνομα μετὰ τῶν ἄλλων ἐνδοξοτάτων ἀνδρῶν.', 'ἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ λάθῃ.',
+             'οἱ μὲν οὖν Ἀθηναῖοι ἐπολέμουν τοῖς Λακεδαιμονίοις.', 'λέγει δὲ ὁ Σωκράτης ὅτι οὐδὲν οἶδεν.']
+
+
+async def ticker(lags, stop):
+    """Measure how late a 10 ms sleep wakes up, which is how long the event loop was blocked."""
+    while not stop.is_set():
+        start_time = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start_time - 0.01)
+
+
+async def main():
+    tagger = Tagger(max_wait=0.005, max_pending=32)
+
+    # A first burst traces every batch size TensorFlow will see, so the second shows the steady state
+    await asyncio.gather(*(tagger.atag(sentences[i % len(sentences)]) for i in range(callers)))
+
+    # Many concurrent callers with a ticker watching the loop
+    lags = []
+    stop = asyncio.Event()
+    ticking = asyncio.create_task(ticker(lags, stop))
+    batches = tagger.batcher.batches
+    most_queued = 0
+    start_time = time.perf_counter()
+    tasks = [asyncio.create_task(tagger.atag(sentences[i % len(sentences)])) for i in range(callers)]
+    while not all(task.done() for task in tasks):
+        most_queued = max(most_queued, tagger.batcher.requests.qsize())
+        await asyncio.sleep(0.001)
+    seconds = time.perf_counter() - start_time
+    stop.set()
+    await ticking
+    results = [task.result() for task in tasks]
+    assert all(len(result) > 0 for result in results)
+    print(f'{callers} callers in {seconds:.02f}s ({callers/seconds:,.0f}/s) over {tagger.batcher.batches - batches} '
+          f'batches. Most requests queued at once: {most_queued} (limit {tagger.max_pending}). Longest event loop '
+          f'stall: {max(lags)*1000:.01f} ms.')
+    assert most_queued <= tagger.max_pending
+
+    # Cancel half of the callers straight away
+    documents = tagger.batcher.documents
+    tasks = [asyncio.create_task(tagger.atag(sentences[i % len(sentences)])) for i in range(callers)]
+    await asyncio.sleep(0)
+    for task in tasks[::2]:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tagged = tagger.batcher.documents - documents
+    print(f'Cancelled {len(tasks[::2])} of {callers} callers. {tagged} requests were tagged.')
+    assert tagged < callers
+
+    # tag() callers on threads and atag() callers together stay within the one limit
+    threads = [threading.Thread(target=tagger.tag, args=(sentences[i % len(sentences)],)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    tasks = [asyncio.create_task(tagger.atag(sentences[i % len(sentences)])) for i in range(callers)]
+    most_queued = 0
+    while not all(task.done() for task in tasks) or any(thread.is_alive() for thread in threads):
+        most_queued = max(most_queued, tagger.batcher.requests.qsize())
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    print(f'{callers} tag() and {callers} atag() callers at once. Most requests queued at once: {most_queued} (limit '
+          f'{tagger.max_pending}).')
+    assert most_queued <= tagger.max_pending
+
+    # Every place was handed back, including those of cancelled callers
+    assert all(tagger.pending.acquire(blocking=False) for _ in range(tagger.max_pending))
+
+
+asyncio.run(main())
@@ -0,0 +1,85 @@
+import os
+import json
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from angel_client import tag_text
+
+# Compare what a short-lived command pays per file when it loads the models itself with what it pays through the
+# tagging daemon, then check that an idle daemon exits on its own and turns away malformed requests.
+files = 5
+idle_timeout = 5
+text = 'ὧν ἐς πολὺ καὶ τὸ ἐμὸν ὄνομα μετὰ τῶν ἄλλων ἐνδοξοτάτων ἀνδρῶν. ἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ λάθῃ. ' * 2
+work_folder = tempfile.mkdtemp()
+socket_path = os.path.join(work_folder, 'angel.sock')
+text_path = os.path.join(work_folder, 'text.txt')
+with open(text_path, 'w', encoding='utf-8') as outfile:
+    outfile.write(text)
+
+
+def run(command):
+    start_time = time.perf_counter()
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return time.perf_counter() - start_time, output
+
+
+def send(request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client, client.makefile('rb') as replies:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        return [json.loads(line) for line in replies]
+
+
+standalone_code = f'''
+import angel
+with open({text_path!r}, encoding='utf-8') as infile:
+    for token, tag in angel.tag(infile.read()):
+        print(f'{{token}}\\t{{tag}}')
+'''
+client_command = [sys.executable, '-m', 'angel_client', '--socket', socket_path, '--idle-timeout', str(idle_timeout),
+                  text_path]
+
+standalone_seconds = []
+for _ in range(files):
+    seconds, standalone_output = run([sys.executable, '-c', standalone_code])
+    standalone_seconds.append(seconds)
+print(f'Loading the models every time: {sum(standalone_seconds) / files * 1000:,.0f} ms per file')
+
+cold_seconds, client_output = run(client_command)
+print(f'First client call, starting the daemon: {cold_seconds * 1000:,.0f} ms')
+warm_seconds = []
+for _ in range(files):
+    seconds, client_output = run(client_command)
+    warm_seconds.append(seconds)
+print(f'Client calls to the warm daemon: {sum(warm_seconds) / files * 1000:,.0f} ms per file')
+# The standalone run also prints progress messages, so only its tagged lines are compared
+assert client_output == ''.join(line for line in standalone_output.splitlines(True) if '\t' in line)
+
+start_time = time.perf_counter()
+while os.path.exists(socket_path) and time.perf_counter() - start_time < idle_timeout + 10:
+    time.sleep(0.5)
+assert not os.path.exists(socket_path), 'The daemon did not exit when idle.'
+print(f'Daemon exited {time.perf_counter() - start_time:.01f}s after the last call (idle timeout {idle_timeout}s).')
+
+# Several clients at once start only one daemon between them
+clients = [subprocess.Popen(client_command, stdout=subprocess.PIPE, text=True) for _ in range(4)]
+outputs = [client.communicate()[0] for client in clients]
+assert all(output == client_output for output in outputs)
+daemons = subprocess.run(['pgrep', '-f', f'angel daemon --socket {socket_path}'], capture_output=True,
+                         text=True).stdout.split()
+print(f'Four clients started together shared {len(daemons)} daemon.')
+assert len(daemons) == 1
+
+# Malformed tokens are turned away without touching the batch a good request is tagged in
+good_replies = []
+good = threading.Thread(target=lambda: good_replies.extend(tag_text(text, socket_path, idle_timeout=idle_timeout)))
+good.start()
+for bad_request in ({'tokens': 'abc'}, {'tokens': [1, 2]}, {'tokens': ['λόγος'], 'annotator': 'Nobody'}):
+    replies = send(bad_request)
+    assert len(replies) == 1 and 'error' in replies[0] and not replies[0].get('internal'), replies
+good.join()
+assert ''.join(f'{token}\t{tag}\n' for token, tag in good_replies) == client_output
+print('Malformed requests were rejected while a good one beside them was tagged.')
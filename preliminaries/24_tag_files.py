@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Time angel-tag over several files with one worker and with more, and check they give exactly the same output.
+file_count = 4
+copies = 400
+text = 'ὧν ἐς πολὺ καὶ τὸ ἐμὸν ὄνομα μετὰ τῶν ἄλλων ἐνδοξοτάτων ἀνδρῶν.\nἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ λάθῃ.\n'
+work_folder = tempfile.mkdtemp()
+paths = []
+for i in range(file_count):
+    paths.append(os.path.join(work_folder, f'text{i}.txt'))
+    with open(paths[-1], 'w', encoding='utf-8') as outfile:
+        outfile.write(text * copies)
+
+outputs = {}
+for jobs in (1, 2, 4):
+    start_time = time.perf_counter()
+    outputs[jobs] = subprocess.run([sys.executable, '-c', 'from angel.__main__ import tag_main; tag_main()',
+                                    '--jobs', str(jobs)] + paths, capture_output=True, text=True, check=True).stdout
+    tokens = outputs[jobs].count('\n')
+    print(f'--jobs {jobs}: {time.perf_counter() - start_time:.02f}s for {tokens:,} tokens in {file_count} files')
+assert outputs[1] == outputs[2] == outputs[4]
+print('Output is identical for every number of jobs.')
@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import contextlib
+import unicodedata
+import numpy as np
+
+# Throughput of each stage of tagging on fixed inputs from a sentence up to a book, timed inside the real entry points.
+#
+#   python 25_throughput_benchmark.py run --output results.json
+#   python 25_throughput_benchmark.py compare baseline.json results.json
+#
+# Each size is tagged through tag(), which the library API uses, and tag_documents(), which the server, daemon, and
+# angel-tag use. The seconds of each stage come from the spans enable_metrics() records inside those calls, so nothing
+# here runs a pipeline of its own. tag() loads the models on every call, which is kept apart from its stages. Inputs
+# are synthetic Greek tokens made from all_norm_characters with a fixed seed, so every run tags exactly the same text
+# without needing anything but the models. compare exits with status 1 if anything got slower, or used more memory,
+# by more than the tolerance.
+sizes = {'sentence': 20, 'paragraph': 200, 'chapter': 2000, 'book': 20000}
+stages = ('tokenization', 'normalization', 'encoding', 'lstm1', 'dnn', 'vectors', 'lstm2_windowing', 'lstm2',
+          'decoding')
+entry_points = ('tag', 'tag_documents')
+
+
+def synthetic_tokens(count, seed=0, vocabulary_size=5000):
+    """Return count Greek-looking tokens drawn the same way on every run.
+
+    Words come from a fixed vocabulary with Zipf-like frequencies, so forms repeat the way they do in real text, and
+    a punctuation mark follows every several words. A few words are longer than the 21 characters LSTM1 sees."""
+    import angel
+    generator = random.Random(seed)
+    letters = [character for character in angel.all_norm_characters if unicodedata.category(character) == 'Ll']
+    vocabulary = [''.join(generator.choice(letters) for _ in range(min(int(generator.expovariate(1/6)) + 1, 25)))
+                  for _ in range(vocabulary_size)]
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    tokens = []
+    while len(tokens) < count:
+        tokens += generator.choices(vocabulary, weights, k=generator.randint(4, 14))
+        tokens.append(generator.choice(('.', ',', '·', ';')))
+    return tokens[:count]
+
+
+def peak_rss():
+    """Return the high-water mark of this process's resident memory in MB."""
+    with open('/proc/self/status') as status_file:
+        status = dict(line.split(':', 1) for line in status_file)
+    return int(status['VmHWM'].split()[0]) / 1024
+
+
+def time_call(entry_point, tokens, morphs):
+    """Tag tokens through tag() or tag_documents(), returning the tags and the seconds each stage took within the call.
+
+    A stage's seconds are summed over every aspect and every time it ran. other is whatever the call spent outside
+    its stages, such as building the result, and load_models is kept out of the stages altogether."""
+    import angel
+    records = []
+    metrics = angel.enable_metrics(records.append)
+    try:
+        if entry_point == 'tag':
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                tags = [token_tag for token, token_tag in angel.tag(' '.join(tokens))]
+        else:
+            tags = [token_tag for token, token_tag in angel.tag_documents([tokens], morphs)[0]]
+    finally:
+        angel.disable_metrics(metrics)
+    record = records[-1]
+    seconds = {stage: 0.0 for stage in stages}
+    for (stage, aspect), stage_seconds in record['stage_seconds'].items():
+        if stage in seconds:
+            seconds[stage] += stage_seconds
+    load_seconds = record['stage_seconds'].get(('load_models', ''), 0.0)
+    seconds['other'] = record['seconds'] - load_seconds - sum(seconds.values())
+    return tags, seconds, load_seconds
+
+
+def clear_caches():
+    import angel
+    angel.normalize_form.cache_clear()
+    angel.oov_vector.cache_clear()
+
+
+def run(args):
+    import angel
+    import tensorflow as tf
+    results = {'environment': {'python': platform.python_version(), 'tensorflow': tf.__version__,
+                               'numpy': np.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count(),
+                               'vectors': type(angel.wv).__name__},
+               'repeats': args.repeats, 'sizes': {}}
+    with contextlib.redirect_stdout(sys.stderr):
+        morphs = angel.create_morph_classes()
+    results['environment']['models'] = type(morphs[0].lstm1).__name__
+    results['rss_after_load_mb'] = peak_rss()
+
+    # One untimed run of each so the first size doesn't pay for tracing
+    for entry_point in entry_points:
+        time_call(entry_point, synthetic_tokens(32), morphs)
+
+    for size, count in sizes.items():
+        if args.sizes and size not in args.sizes:
+            continue
+        tokens = synthetic_tokens(count)
+        assert angel.tokenize(' '.join(tokens))[0] == tokens
+        results['sizes'][size] = {'tokens': count}
+        tags = {}
+        for entry_point in entry_points:
+            runs = []
+            load_seconds = []
+            for _ in range(args.repeats):
+                clear_caches()
+                tags[entry_point], seconds, call_load_seconds = time_call(entry_point, tokens, morphs)
+                runs.append(seconds)
+                load_seconds.append(call_load_seconds)
+            median_seconds = {stage: float(np.median([seconds[stage] for seconds in runs])) for stage in runs[0]}
+            total_seconds = sum(median_seconds.values())
+            results['sizes'][size][entry_point] = {
+                'seconds': median_seconds, 'total_seconds': total_seconds,
+                'load_models_seconds': float(np.median(load_seconds)),
+                'tokens_per_second': {stage: count / max(stage_seconds, 1e-9)
+                                      for stage, stage_seconds in median_seconds.items()},
+                'total_tokens_per_second': count / total_seconds}
+            print(f'{size} ({count:,} tokens) {entry_point}(): {count / total_seconds:,.0f} tokens/s, ' +
+                  ', '.join(f'{stage} {stage_seconds * 1000:,.1f} ms' for stage, stage_seconds in median_seconds.items()
+                            if stage_seconds > 0))
+
+        # Both entry points must tag the same text the same way
+        assert tags['tag'] == tags['tag_documents']
+        results['sizes'][size]['peak_rss_mb'] = peak_rss()
+
+    # What a call costs beyond its tokens: a one-token document through tag_documents() and a one-word tag(), which
+    # loads the models every time
+    call_seconds = []
+    for _ in range(20):
+        start_time = time.perf_counter()
+        angel.tag_documents([['λόγος']], morphs)
+        call_seconds.append(time.perf_counter() - start_time)
+    results['tag_documents_call_ms'] = float(np.median(call_seconds)) * 1000
+    call_seconds = []
+    for _ in range(3):
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            angel.tag('λόγος')
+        call_seconds.append(time.perf_counter() - start_time)
+    results['tag_call_ms'] = float(np.median(call_seconds)) * 1000
+    results['peak_rss_mb'] = peak_rss()
+    print(f'Per call: tag_documents() {results["tag_documents_call_ms"]:,.1f} ms, tag() {results["tag_call_ms"]:,.0f} '
+          f'ms. Peak RSS {results["peak_rss_mb"]:,.0f} MB.')
+
+    with open(args.output, 'w', encoding='utf-8') as json_file:
+        json.dump(results, json_file, indent=2)
+    print(f'Saved {args.output}')
+
+
+def compare(args):
+    """Print every measurement next to its baseline and return the number which regressed past the tolerance."""
+    with open(args.baseline, encoding='utf-8') as json_file:
+        baseline = json.load(json_file)
+    with open(args.results, encoding='utf-8') as json_file:
+        results = json.load(json_file)
+    if baseline['environment'] != results['environment']:
+        print(f'Warning: the environments differ.\n  baseline {baseline["environment"]}\n  results  '
+              f'{results["environment"]}')
+    if set(baseline['sizes']) != set(results['sizes']):
+        print('Warning: different sizes were run, so peak RSS is not comparable.')
+
+    # Each row is a name, the two values, and whether bigger is better
+    rows = []
+    for size, measured in results['sizes'].items():
+        if size not in baseline['sizes']:
+            continue
+        for entry_point in entry_points:
+            before, after = baseline['sizes'][size][entry_point], measured[entry_point]
+            for stage in before['seconds']:
+                # Stages too quick to time reliably would only add noise
+                if before['seconds'][stage] >= args.min_seconds and stage != 'other':
+                    rows.append((f'{size} {entry_point} {stage} tokens/s', before['tokens_per_second'][stage],
+                                 after['tokens_per_second'][stage], True))
+            rows.append((f'{size} {entry_point} total tokens/s', before['total_tokens_per_second'],
+                         after['total_tokens_per_second'], True))
+    for name in ('tag_documents_call_ms', 'tag_call_ms', 'rss_after_load_mb', 'peak_rss_mb'):
+        rows.append((name, baseline[name], results[name], False))
+
+    regressions = 0
+    for name, before, after, bigger_is_better in rows:
+        change = after / before - 1
+        regressed = -change > args.tolerance if bigger_is_better else change > args.tolerance
+        regressions += regressed
+        print(f'{"REGRESSION " if regressed else ""}{name}: {before:,.1f} -> {after:,.1f} ({change:+.1%})')
+    print(f'{regressions} regressions beyond {args.tolerance:.0%}.')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the throughput of each stage of the tagging pipeline.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='Run the benchmark and save the results as JSON.')
+    run_parser.add_argument('--output', default='benchmark.json')
+    run_parser.add_argument('--repeats', type=int, default=3, help='Runs per size. The median is kept. Default 3.')
+    run_parser.add_argument('--sizes', nargs='*', choices=list(sizes), help='Only run these sizes.')
+    compare_parser = commands.add_parser('compare', help='Flag regressions of one set of results against another.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1,
+                                help='Fraction a measurement may get worse by before it counts. Default 0.1.')
+    compare_parser.add_argument('--min-seconds', type=float, default=0.001,
+                                help='Stages which took less than this in the baseline are skipped. Default 0.001.')
+    arguments = parser.parse_args()
+    if arguments.command == 'run':
+        run(arguments)
+    elif compare(arguments):
+        sys.exit(1)
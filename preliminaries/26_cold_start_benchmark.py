@@ -0,0 +1,100 @@
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+# How long a fresh process takes to become ready to tag, and how much memory it holds along the way. Every run is a
+# new interpreter, so nothing is imported, traced, or loaded before it starts. Files the OS already has cached still
+# are, so run this after dropping the page cache to see a truly cold machine.
+#
+#   python 26_cold_start_benchmark.py --repeats 5 --output cold_start.json
+
+# Each phase prints the wall clock time and this process's memory when it ends
+phases_code = '''
+import json, sys, time
+def mark(phase, **extra):
+    status = dict(line.split(":", 1) for line in open("/proc/self/status"))
+    print(json.dumps(dict(phase=phase, time=time.time(), rss_mb=int(status["VmRSS"].split()[0]) / 1024,
+                          peak_rss_mb=int(status["VmHWM"].split()[0]) / 1024, **extra)), flush=True)
+mark("interpreter")
+import numpy, tensorflow, gensim
+mark("dependencies")
+import angel
+mark("import angel", word_vectors_seconds=angel.word_vectors_seconds)
+'''
+
+# Load each aspect's models in turn so every aspect gets its own phase
+per_aspect_code = phases_code + '''
+weights = angel.model_weights()
+morphs = []
+for title, tags in angel.morph_tags.items():
+    models = [angel.load_stage(weights, title, stage)[0] for stage in ("lstm1", "dnn", "lstm2")]
+    morphs.append(angel.Morphs(title, tags, *models, weights=weights))
+    mark(title + " models")
+angel.tag_documents([angel.tokenize({sentence!r})[0]], morphs)
+mark("first sentence")
+'''
+
+# Load the models the way the tagger really does, all at once on a pool of threads
+ready_code = phases_code + '''
+import contextlib
+with contextlib.redirect_stdout(sys.stderr):
+    morphs = angel.create_morph_classes()
+mark("all models")
+angel.tag_documents([angel.tokenize({sentence!r})[0]], morphs)
+mark("first sentence")
+'''
+
+sentence = 'ἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ λάθῃ.'
+
+
+def run_fresh(code):
+    """Run the code in a new interpreter and return its phases, timed from just before the process was started."""
+    start_time = time.time()
+    output = subprocess.run([sys.executable, '-c', code.format(sentence=sentence)], capture_output=True, text=True,
+                            check=True).stdout
+    phases = [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+    for phase in phases:
+        phase['elapsed'] = phase.pop('time') - start_time
+    return phases
+
+
+def summarize(runs):
+    """Return the median of every measurement of every phase over several runs."""
+    summary = []
+    for phase_runs in zip(*runs):
+        phase = {'phase': phase_runs[0]['phase']}
+        for key in phase_runs[0]:
+            if key != 'phase':
+                phase[key] = float(np.median([run[key] for run in phase_runs]))
+        summary.append(phase)
+    return summary
+
+
+def print_phases(title, phases):
+    print(title)
+    previous = 0
+    for phase in phases:
+        extra = f' (word vectors {phase["word_vectors_seconds"]:.02f}s)' if 'word_vectors_seconds' in phase else ''
+        print(f'  {phase["phase"]:>16}: {phase["elapsed"]:6.02f}s, +{phase["elapsed"] - previous:5.02f}s, RSS '
+              f'{phase["rss_mb"]:,.0f} MB, peak {phase["peak_rss_mb"]:,.0f} MB{extra}')
+        previous = phase['elapsed']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each phase of a fresh tagger process becoming ready.')
+    parser.add_argument('--repeats', type=int, default=3, help='Fresh processes per measurement. Default 3.')
+    parser.add_argument('--output', help='Save the median phases as JSON.')
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in (('per_aspect', per_aspect_code), ('ready', ready_code)):
+        results[name] = summarize([run_fresh(code) for _ in range(args.repeats)])
+    print_phases('Loading one aspect at a time:', results['per_aspect'])
+    print_phases('Loading every model at once, as create_morph_classes() does:', results['ready'])
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f'Saved {args.output}')
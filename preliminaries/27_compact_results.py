@@ -0,0 +1,42 @@
+import time
+import tracemalloc
+import numpy as np
+import angel
+from angel.results import TaggedTokens
+
+# Compare the memory of a million tagged tokens held as TaggedTokens with the tuple of (token, tag) pairs tag() used to
+# return, and the time it takes to find every subjunctive verb in each. The tags are random, since only their layout
+# matters here.
+token_count = 1_000_000
+generator = np.random.default_rng(0)
+words = angel.tokenize('ὧν ἐς πολὺ καὶ τὸ ἐμὸν ὄνομα μετὰ τῶν ἄλλων ἐνδοξοτάτων ἀνδρῶν. ἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ '
+                       'λάθῃ.')[0]
+text = ' '.join(words[i % len(words)] for i in range(token_count))
+offsets = np.array(angel.tokenize(text)[1], dtype=np.int64)
+
+tracemalloc.start()
+tag_indices = np.stack([generator.integers(0, len(tags) + 1, token_count, dtype=np.uint8)
+                        for tags in angel.morph_tags.values()], axis=1)
+confidences = generator.random((token_count, len(angel.morph_tags)), dtype=np.float32)
+result = TaggedTokens(text, offsets, tag_indices, confidences, angel.morph_tags)
+compact_bytes = tracemalloc.get_traced_memory()[0] + offsets.nbytes
+tracemalloc.stop()
+
+# Timed before the tuples exist, since a million tuples also make every garbage collection pass slower
+start_time = time.perf_counter()
+subjunctives = result.where(pos='v', mood='s')
+compact_seconds = time.perf_counter() - start_time
+
+tracemalloc.start()
+pairs = tuple(result)
+tuple_bytes = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+print(f'{token_count:,} tokens: TaggedTokens {compact_bytes / 2**20:,.0f} MB with confidences, tuple of pairs '
+      f'{tuple_bytes / 2**20:,.0f} MB without them')
+
+start_time = time.perf_counter()
+subjunctive_pairs = [pair for pair in pairs if pair[1][0] == 'v' and pair[1][4] == 's']
+tuple_seconds = time.perf_counter() - start_time
+assert subjunctives == subjunctive_pairs
+print(f'Finding {len(subjunctives):,} subjunctive verbs: where() {compact_seconds * 1000:,.1f} ms, scanning the '
+      f'tuples {tuple_seconds * 1000:,.1f} ms')
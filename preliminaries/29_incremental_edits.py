@@ -0,0 +1,47 @@
+import time
+import contextlib
+import angel
+
+# Check that a TaggedDocument edited with apply_edit() ends up exactly where tagging the edited text from scratch does:
+# the same text, tokens, offsets, and tags. Edits next to punctuation and at both ends are included, since those are
+# where new text could run into the tokens around it.
+with contextlib.redirect_stdout(None):
+    morphs = angel.create_morph_classes()
+text = 'ὁ λόγος, καλός ἐστι. ἐγὼ δὲ ταῦτα ἔγραψα ἵνα μὴ λάθῃ·καὶ ἄλλα.'
+
+# Each edit is a (start, stop) token span and the text to put there
+edits = [((13, 14), ''), ((2, 3), 'καί'), ((2, 2), 'δέ'), ((1, 2), 'λόγοι'), ((3, 3), ','), ((0, 0), 'καὶ'),
+         ((14, 14), 'τέλος'), ((11, 13), ''), ((12, 13), ''), ((4, 6), 'ἦν δ’ ἀγαθός;'), ((5, 5), '(ὡς ἔοικε)'),
+         ((0, 1), 'Ὁ'), ((25, 25), 'τέλος')]
+
+document = angel.TaggedDocument(text, morphs=morphs)
+for span, new_text in edits:
+    if span[1] > span[0]:
+        before, after = document.text[:document.offsets[span[0], 0]], document.text[document.offsets[span[1]-1, 1]:]
+    else:
+        position = document.offsets[span[0], 0] if span[0] < len(document) else len(document.text)
+        before, after = document.text[:position], document.text[position:]
+    start_time = time.perf_counter()
+    document.apply_edit(span, new_text)
+    seconds = time.perf_counter() - start_time
+
+    # The rest of the text is untouched, and new_text goes in as written, spaced off only from words it would join
+    assert document.text.startswith(before) and document.text.endswith(after), (span, new_text, document.text)
+    inserted = document.text[len(before):len(document.text) - len(after)]
+    assert inserted in (new_text, f' {new_text}', f'{new_text} ', f' {new_text} ', ' ' if not new_text else None)
+    tokens, offsets = angel.tokenize(document.text)
+    assert tokens == document.tokens, (span, new_text, document.text, document.tokens)
+    assert offsets == [tuple(offset) for offset in document.offsets.tolist()], (span, new_text, document.text)
+    assert all(document.text[start:end] == token for token, (start, end) in zip(tokens, offsets))
+    fresh = angel.TaggedDocument(document.text, morphs=morphs)
+    assert list(document) == list(fresh), (span, new_text, document.text)
+    print(f'{span} -> {new_text!r}: {document.text!r} ({seconds * 1000:.1f} ms)')
+print(f'All {len(edits)} edits match tagging the edited text from scratch.')
+
+# Editing a word next to punctuation leaves the punctuation where it was
+document = angel.TaggedDocument('ὁ λόγος, καλός·ἐστι.', morphs=morphs)
+document.apply_edit((1, 2), 'λόγοι')
+document.apply_edit((5, 6), '')
+document.apply_edit((5, 5), 'ἦν')
+assert document.text == 'ὁ λόγοι, καλός·ἦν.', document.text
+print(f'Edits next to punctuation keep the text as written: {document.text!r}')
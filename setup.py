@@ -29,10 +29,14 @@ setup(
     classifiers=classifiers,
     keywords=['greek', 'ancient greek', 'morphology', 'classics', 'computational linguistics'],
     packages=find_packages(),
+    py_modules=['angel_client'],
     python_requires='>=3.7,<3.9',
     install_requires=['numpy',
                       'tensorflow',
                       'gdown',
                       'greek_normalisation',
-                      'gensim']
+                      'gensim'],
+    extras_require={'arrow': ['pyarrow'], 'pandas': ['pyarrow', 'pandas']},
+    entry_points={'console_scripts': ['angel=angel.__main__:main', 'angel-client=angel_client:main',
+                                      'angel-tag=angel.__main__:tag_main']}
 )